@@ -0,0 +1,100 @@
+"""Measure cold-start import time of the app's entry points and core modules.
+
+Every sample runs in a fresh interpreter, so nothing is cached in sys.modules:
+
+    python benchmarks/bench_import.py --repeat 10
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+DEFAULT_MODULES = ("fields", "extraction", "master_store", "exporters", "gemini_client", "job_queue",
+                   "cardSnap_cli", "cardSnap", "cardSnap_Streamlit")
+TOP_IMPORTS = 10
+
+
+def run_python(args, env):
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, *args], cwd=str(ROOT), env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    return time.perf_counter() - started, completed
+
+
+def parse_importtime(stderr):
+    """Return {module: cumulative_us} from -X importtime output."""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        cumulative[name] = int(cumulative_us)
+    return cumulative
+
+
+def measure(label, args, repeat, env):
+    wall = []
+    for _ in range(repeat):
+        elapsed, completed = run_python(args, env)
+        if completed.returncode != 0:
+            return {"target": label, "error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"}
+        wall.append(elapsed)
+    _, completed = run_python(["-X", "importtime", *args], env)
+    imports = parse_importtime(completed.stderr)
+    top = sorted(imports.items(), key=lambda item: item[1], reverse=True)[:TOP_IMPORTS]
+    return {
+        "target": label,
+        "wall_ms_median": 1000 * statistics.median(wall),
+        "wall_ms_min": 1000 * min(wall),
+        "top_imports_ms": {name: cumulative_us / 1000 for name, cumulative_us in top},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark cold-start import time.")
+    parser.add_argument("modules", nargs="*", default=list(DEFAULT_MODULES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/import-<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    # cardSnap builds its API client at import time; a placeholder key keeps that offline.
+    env = {**os.environ, "API_KEY": os.environ.get("API_KEY", "benchmark")}
+    targets = [(module, ["-c", f"import {module}"]) for module in args.modules]
+    targets.append(("cardSnap_cli --help", ["cardSnap_cli.py", "--help"]))
+    baseline = measure("python (empty)", ["-c", "pass"], args.repeat, env)
+
+    results = []
+    for label, target_args in targets:
+        result = measure(label, target_args, args.repeat, env)
+        if "error" in result:
+            print(f"{label:<24} skipped: {result['error']}", file=sys.stderr)
+        else:
+            result["import_ms_median"] = result["wall_ms_median"] - baseline["wall_ms_median"]
+            print(f"{label:<24} {result['import_ms_median']:8.1f} ms over interpreter startup", file=sys.stderr)
+        results.append(result)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "interpreter_ms_median": baseline["wall_ms_median"],
+        "targets": results,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"import-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""Benchmark the ingest path against the local mock Gemini server.
+
+Each batch size runs in its own subprocess so peak RSS is measured per run:
+
+    python benchmarks/bench_ingest.py --sizes 10,1000,10000 --latency 0.05 --error-rate 0.02
+"""
+import argparse
+import io
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from functools import partial
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from PIL import Image, ImageDraw  # noqa: E402
+
+import metrics  # noqa: E402
+from extraction import extract_batch, get_file_hash  # noqa: E402
+from gemini_client import GeminiClient  # noqa: E402
+from image_prep import DEFAULT_FORMAT, DEFAULT_MAX_DIMENSION, DEFAULT_QUALITY  # noqa: E402
+from master_store import MasterStore, to_master_row  # noqa: E402
+from mock_gemini_server import start_mock_server  # noqa: E402
+from pipeline import DEFAULT_MAX_WORKERS, imap_ordered, iter_batches  # noqa: E402
+from scheduler import DEFAULT_LATENCY_TARGET, AdaptiveScheduler  # noqa: E402
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DEFAULT_SIZES = "10,1000,10000"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+# The app's own spans (see metrics.STAGES), plus normalize, which only the benchmark times.
+STAGES = ("preprocess", "encode", "api_request", "parse", "normalize", "store_write")
+CARD_SIZE = (1050, 600)
+
+
+def synthetic_card(index, seed=0):
+    """Render a card-like JPEG; the index is drawn on it so every card hashes differently."""
+    rng = random.Random(seed * 1_000_003 + index)
+    img = Image.new("RGB", CARD_SIZE, tuple(rng.randint(200, 255) for _ in range(3)))
+    draw = ImageDraw.Draw(img)
+    for _ in range(40):
+        x, y = rng.randrange(CARD_SIZE[0]), rng.randrange(CARD_SIZE[1])
+        draw.ellipse((x, y, x + rng.randint(5, 60), y + rng.randint(5, 60)),
+                     fill=tuple(rng.randint(0, 255) for _ in range(3)))
+    lines = [f"Card #{index}", "Jane Example", "Director of Benchmarks", "+1 (555) 010-0000",
+             f"jane{index}@example.com", "www.example.com", "1 Main Street, Springfield"]
+    for row, text in enumerate(lines):
+        draw.text((60, 60 + row * 60), text, fill=(20, 20, 20))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=95)
+    return out.getvalue()
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(stage):
+    """Per-stage summary from a metrics snapshot; percentiles are histogram bucket bounds."""
+    return {
+        "count": stage["count"],
+        "total_s": stage["total_s"],
+        "mean_ms": 1000 * stage["mean_s"],
+        "p50_ms": 1000 * stage["p50_s"],
+        "p95_ms": 1000 * stage["p95_s"],
+    }
+
+
+def run_size(args):
+    """Ingest args.size synthetic cards through extraction.extract_batch and return the result dict for that run."""
+    client = GeminiClient("benchmark", base_url=args.base_url, pool_size=args.workers, backoff_base=0.01,
+                          rate_limiter=AdaptiveScheduler(args.requests_per_second, args.workers,
+                                                         latency_target=args.latency_target))
+    counts = {"added": 0, "duplicates": 0, "failed": 0}
+    metrics.REGISTRY.reset()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = MasterStore(str(Path(tmp) / "bench_master.db"))
+        cards = ((get_file_hash(image), image, f"card_{index}.jpg")
+                 for index, image in ((index, synthetic_card(index, args.seed)) for index in range(args.size)))
+        extract = partial(extract_batch, client=client, max_dimension=args.max_dimension, quality=args.quality,
+                          image_format=args.image_format)
+
+        started = time.perf_counter()
+        for batch, results, batch_error in imap_ordered(extract, iter_batches(cards, args.batch_size), args.workers):
+            for (_, _, file_name), (info, _, error) in zip(batch, results or [(None, {}, batch_error)] * len(batch)):
+                if error or not info:
+                    counts["failed"] += 1
+                    continue
+                with metrics.span("normalize"):
+                    row = to_master_row(info, file_name)
+                counts["added" if store.add(row) else "duplicates"] += 1
+        elapsed = time.perf_counter() - started
+        store.close()
+
+    api_stats = client.stats()
+    client.close()
+    snapshot = metrics.REGISTRY.snapshot()
+    return {
+        "cards": args.size,
+        "workers": args.workers,
+        "batch_size": args.batch_size,
+        "elapsed_s": elapsed,
+        "cards_per_sec": args.size / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+        **counts,
+        "api": {name: api_stats[name] for name in ("requests", "retries", "failures", "parse_retries", "usage", "scheduler")},
+        "counters": snapshot["counters"],
+        "stages": {stage: summarize(snapshot["stages"][stage]) for stage in STAGES if stage in snapshot["stages"]},
+    }
+
+
+def print_result(result, out=sys.stderr):
+    rss = f"{result['peak_rss_mb']:.0f} MB" if result["peak_rss_mb"] is not None else "n/a"
+    print(f"{result['cards']} cards: {result['cards_per_sec']:.1f} cards/sec, peak RSS {rss}, "
+          f"{result['api']['requests']} requests, {result['api']['retries']} retries, {result['failed']} failed, "
+          f"~${result['api']['usage']['estimated_cost']:.4f}", file=out)
+    for stage, summary in result["stages"].items():
+        print(f"  {stage:<11} mean {summary['mean_ms']:8.2f} ms  p50 <= {summary['p50_ms']:8.1f} ms  "
+              f"p95 <= {summary['p95_ms']:8.1f} ms  total {summary['total_s']:8.2f} s", file=out)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark card ingestion against a mock Gemini server.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated batch sizes, one subprocess each")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=1, help="Cards per extract_batch call (multi-card requests above 1)")
+    parser.add_argument("--requests-per-second", type=float, default=0.0,
+                        help="Scheduler's upper rate limit; 0 leaves only its concurrency window")
+    parser.add_argument("--latency-target", type=float, default=DEFAULT_LATENCY_TARGET)
+    parser.add_argument("--latency", type=float, default=0.05, help="Mock server mean latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of mock responses that are 429/503")
+    parser.add_argument("--prose", action="store_true", help="Have the mock wrap its JSON in prose and code fences")
+    parser.add_argument("--max-dimension", type=int, default=DEFAULT_MAX_DIMENSION)
+    parser.add_argument("--quality", type=int, default=DEFAULT_QUALITY)
+    parser.add_argument("--image-format", default=DEFAULT_FORMAT)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/ingest-<timestamp>.json)")
+    # Internal: run a single size against an already running server and print its result as JSON.
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.size is not None:
+        json.dump(run_size(args), sys.stdout)
+        return 0
+
+    random.seed(args.seed)
+    server, base_url = start_mock_server(args.latency, args.jitter, args.error_rate, args.prose)
+    child_args = [
+        "--workers", str(args.workers), "--batch-size", str(args.batch_size),
+        "--requests-per-second", str(args.requests_per_second), "--latency-target", str(args.latency_target),
+        "--max-dimension", str(args.max_dimension), "--quality", str(args.quality),
+        "--image-format", args.image_format, "--seed", str(args.seed), "--base-url", base_url,
+    ]
+    runs = []
+    try:
+        for size in (int(size) for size in args.sizes.split(",") if size.strip()):
+            completed = subprocess.run([sys.executable, __file__, "--size", str(size), *child_args],
+                                       check=True, stdout=subprocess.PIPE, text=True)
+            result = json.loads(completed.stdout)
+            print_result(result)
+            runs.append(result)
+    finally:
+        server.shutdown()
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {name: getattr(args, name) for name in (
+            "workers", "batch_size", "requests_per_second", "latency_target", "latency", "jitter", "error_rate", "prose",
+            "max_dimension", "quality", "image_format", "seed")},
+        "runs": runs,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"ingest-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
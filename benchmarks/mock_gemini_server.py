@@ -0,0 +1,94 @@
+import argparse
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIRST_NAMES = ["Jon", "Jonathan", "Priya", "Chen", "Maria", "Ahmed", "Olga", "Kenji", "Ada", "Luis"]
+LAST_NAMES = ["Smith", "Patel", "Wang", "Garcia", "Khan", "Ivanova", "Sato", "Lovelace", "Moreno", "Okafor"]
+COMPANIES = ["Acme Inc", "Globex LLC", "Initech", "Umbrella Corp", "Hooli", "Stark Industries", "Wayne Enterprises"]
+TITLES = ["CEO", "CTO", "Sales Manager", "Software Engineer", "Director of Marketing", "Consultant"]
+
+
+def fake_card(seed):
+    rng = random.Random(seed)
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    company = rng.choice(COMPANIES)
+    domain = company.split()[0].lower() + ".com"
+    return {
+        "Company Name": company,
+        "Person Name": f"{first} {last}",
+        "Designation": rng.choice(TITLES),
+        "Phone": f"+1 ({rng.randint(200, 999)}) {rng.randint(200, 999)}-{rng.randint(1000, 9999)}",
+        "Email": f"{first.lower()}.{last.lower()}{rng.randint(1, 9999)}@{domain}",
+        "Website": f"www.{domain}",
+        "Address": f"{rng.randint(1, 999)} Main Street, Springfield",
+    }
+
+
+def make_handler(latency, jitter, error_rate, prose):
+    class MockGeminiHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(max(0.0, random.gauss(latency, jitter)))
+
+            if random.random() < error_rate:
+                status = random.choice([429, 503])
+                self.send_response(status)
+                self.send_header("Retry-After", "0")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            request = json.loads(body)
+            images = [part["inlineData"]["data"] for part in request["contents"][0]["parts"] if "inlineData" in part]
+            cards = [fake_card(hashlib.md5(data.encode("ascii")).hexdigest()) for data in images]
+            text = json.dumps(cards if len(cards) > 1 else cards[0])
+            if prose:
+                text = f"Here is the extracted data:\n```json\n{text}\n```"
+            payload = json.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]}).encode("utf-8")
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MockGeminiHandler
+
+
+def start_mock_server(latency=0.2, jitter=0.05, error_rate=0.0, prose=False, host="127.0.0.1", port=0):
+    """Start a fake generateContent server on a background thread. Returns (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), make_handler(latency, jitter, error_rate, prose))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/v1beta"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a fake Gemini generateContent endpoint.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mean response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 429/503")
+    parser.add_argument("--prose", action="store_true", help="Wrap the JSON in prose and a code fence")
+    args = parser.parse_args(argv)
+
+    server, base_url = start_mock_server(args.latency, args.jitter, args.error_rate, args.prose, port=args.port)
+    print(f"Mock Gemini server at {base_url}", file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,185 +1,107 @@
 import os
-import requests
-import base64
-import json
-import openpyxl
-from tkinter import Tk, filedialog, messagebox, Button, Label, Frame
-import webbrowser
-import http.server
-import socketserver
 import threading
 import time
+import queue
 from pathlib import Path
+import metrics
+from fields import resolve_field
+from gemini_client import ApiError, GeminiClient, MalformedResponseError
+from pipeline import DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_SECOND, imap_ordered
+from scheduler import AdaptiveScheduler
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+API_KEY = os.getenv("API_KEY")
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", DEFAULT_MAX_WORKERS))
+REQUESTS_PER_SECOND = float(os.getenv("REQUESTS_PER_SECOND", DEFAULT_REQUESTS_PER_SECOND))
+POLL_INTERVAL_MS = 100
+FLUSH_EVERY_ROWS = 25
+FLUSH_EVERY_SECONDS = 10.0
+HEADERS = ["Company Name", "Person Name", "Designation", "Phone", "Email", "Website", "Address"]
+api_client = GeminiClient(API_KEY, pool_size=MAX_WORKERS, rate_limiter=AdaptiveScheduler(REQUESTS_PER_SECOND, MAX_WORKERS))
 
 
-
-def encode_image(image_path):
+def extract_info_from_image(image_path):
     with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
+        image_data = image_file.read()
 
-def extract_info_from_image(image_path):
-    image_data = encode_image(image_path)
-    url = f"https://generativelanguage.googleapis.com/v1/models/gemini-1.5-flash:generateContent?key={API_KEY}"
-    headers = {
-        "Content-Type": "application/json"
-    }
-    prompt = {
-        "contents": [
-            {
-                "parts": [
-                    {
-                        "text": "Extract the Company Name, Person's Name, Designation, Phone, Email, Website, and Address from this business card. Respond only with JSON format. Use exactly these field names: 'Company Name', 'Person Name', 'Designation', 'Phone', 'Email', 'Website', 'Address'. Do NOT use triple backticks or markdown."
-                    },
-                    {
-                        "inlineData": {
-                            "mimeType": "image/jpeg",
-                            "data": image_data
-                        }
-                    }
-                ]
-            }
-        ]
-    }
-    
-    response = requests.post(url, headers=headers, data=json.dumps(prompt))
-    if response.status_code == 200:
-        try:
-            data = response.json()
-            extracted_text = data['candidates'][0]['content']['parts'][0]['text']
-
-            if "```json" in extracted_text:
-                extracted_text = extracted_text.replace("```json", "").replace("```", "").strip()
-            elif "```" in extracted_text:
-                start_idx = extracted_text.find("```") + 3
-                end_idx = extracted_text.rfind("```")
-                if end_idx > start_idx:
-                    extracted_text = extracted_text[start_idx:end_idx].strip()
-                else:
-                    extracted_text = extracted_text.replace("```", "").strip()
-
-            print("Cleaned JSON text:", extracted_text)
-            json_data = json.loads(extracted_text)
-
-            print("Extracted data:", json_data)
-
-            return json_data
-        except json.JSONDecodeError as e:
-            print("Error decoding JSON:", e)
-            print("Raw response:", response.text)
-            return None
-        except KeyError as e:
-            print(f"Error accessing key in JSON: {e}")
-            print("Raw response:", response.text)
-            return None
-        except Exception as e:
-            print("An unexpected error occurred:", e)
-            print("Raw response:", response.text)
-            return None
-    else:
-        print("API Error:", response.status_code, response.text)
+    try:
+        json_data = api_client.extract_info_from_image(image_data)
+        print("Extracted data:", json_data)
+        return json_data
+    except MalformedResponseError as e:
+        print("Error decoding JSON:", e)
+        return None
+    except ApiError as e:
+        print(e)
+        return None
+    except Exception as e:
+        print("An unexpected error occurred:", e)
         return None
 
 
-def save_to_excel(info_dict, file_name="business_card_output.xlsx"):
+def get_output_path(file_name="business_card_output.xlsx"):
     downloads_path = str(Path.home() / "Downloads")
-    full_path = os.path.join(downloads_path, file_name)
-
-    headers = ["Company Name", "Person Name", "Designation", "Phone", "Email", "Website", "Address"]
-
-    field_mapping = {
-        "company name": "Company Name",
-        "company's name": "Company Name",
-        "company": "Company Name",
-
-        "person's name": "Person Name",
-        "person name": "Person Name",
-        "name": "Person Name",
-        "person": "Person Name",
-        "full name": "Person Name",
-
-        "designation": "Designation",
-        "title": "Designation",
-        "job title": "Designation",
-        "position": "Designation",
-        "role": "Designation",
-
-        "phone": "Phone",
-        "phone number": "Phone",
-        "mobile": "Phone",
-        "telephone": "Phone",
-        "tel": "Phone",
-        "contact": "Phone",
-
-        "email": "Email",
-        "mail": "Email",
-        "e-mail": "Email",
-        "email address": "Email",
-
-        "website": "Website",
-        "web": "Website",
-        "url": "Website",
-        "site": "Website",
-        "web address": "Website",
-
-        "address": "Address",
-        "location": "Address",
-        "office": "Address",
-        "office address": "Address",
-    }
-
-    print("Original data from API:", info_dict)
+    return os.path.join(downloads_path, file_name)
 
-    normalized_data = {}
-    for field, value in info_dict.items():
-        normalized_field = field.lower().replace("'", "").strip()
 
-        print(f"Processing field: '{field}' (normalized to '{normalized_field}')")
+def open_output_workbook(full_path):
+    import openpyxl
+
+    if os.path.isfile(full_path):
+        wb = openpyxl.load_workbook(full_path)
+        ws = wb.active
+        for col_idx, header in enumerate(HEADERS, start=1):
+            if ws.cell(row=1, column=col_idx).value != header:
+                ws.cell(row=1, column=col_idx).value = header
+    else:
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = "Business Cards"
+        for col_idx, header in enumerate(HEADERS, start=1):
+            ws.cell(row=1, column=col_idx).value = header
+    return wb, ws
 
-        standard_field = None
-        for key, std_field in field_mapping.items():
-            if normalized_field == key or key in normalized_field:
-                standard_field = std_field
-                print(f"  → Mapped to standard field: '{std_field}'")
-                break
 
+def append_card_row(ws, info_dict):
+    normalized_data = {}
+    for field, value in info_dict.items():
+        standard_field = resolve_field(field)
         if standard_field:
             normalized_data[standard_field] = value
         else:
             print(f"Warning: Unknown field '{field}' - adding as-is")
             normalized_data[field] = value
 
-    print("Normalized data:", normalized_data)
+    ws.append([normalized_data.get(header, None) for header in HEADERS])
+    metrics.inc("rows_written")
 
-    try:
-        if os.path.isfile(full_path):
-            wb = openpyxl.load_workbook(full_path)
-            ws = wb.active
-            for col_idx, header in enumerate(headers, start=1):
-                if ws.cell(row=1, column=col_idx).value != header:
-                    ws.cell(row=1, column=col_idx).value = header
-        else:
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = "Business Cards"
-            for col_idx, header in enumerate(headers, start=1):
-                ws.cell(row=1, column=col_idx).value = header
 
-        next_row = ws.max_row + 1
+def write_atomically(wb, full_path):
+    # Imported here: exporters pulls in the SQLite store, which the Tk app otherwise never needs.
+    from exporters import atomic_output
+
+    # atomic_output keeps the permissions of the workbook being replaced.
+    with atomic_output(full_path, ".xlsx", prefix=".cardsnap-") as temp_path:
+        wb.save(temp_path)
 
-        for col_idx, header in enumerate(headers, start=1):
-            value = normalized_data.get(header, None)
-            ws.cell(row=next_row, column=col_idx).value = value
-            print(f"Writing '{header}': '{value}' to cell ({next_row}, {col_idx})")
 
-        wb.save(full_path)
+def save_workbook(wb, full_path):
+    try:
+        with metrics.span("workbook_save"):
+            write_atomically(wb, full_path)
         print(f"Data saved to {full_path}")
         return full_path
 
     except Exception as e:
         print(f"Error saving file: {e}")
         try:
-            fallback_path = os.path.join(os.getcwd(), file_name)
-            wb.save(fallback_path)
+            fallback_path = os.path.join(os.getcwd(), os.path.basename(full_path))
+            write_atomically(wb, fallback_path)
             print(f"Data saved to fallback location: {fallback_path}")
             return fallback_path
         except Exception as e2:
@@ -187,35 +109,80 @@ def save_to_excel(info_dict, file_name="business_card_output.xlsx"):
             return None
 
 
-def serve_file_for_download(file_path):
-    directory = os.path.dirname(file_path)
-    filename = os.path.basename(file_path)
+class ExcelBatchWriter:
+    """Keeps the output workbook open for a batch and saves it every N rows, every N seconds and on close."""
+
+    def __init__(self, full_path, flush_every_rows=FLUSH_EVERY_ROWS, flush_every_seconds=FLUSH_EVERY_SECONDS):
+        self.full_path = full_path
+        self.flush_every_rows = flush_every_rows
+        self.flush_every_seconds = flush_every_seconds
+        self.saved_path = None
+        self.wb, self.ws = open_output_workbook(full_path)
+        self._pending_rows = 0
+        self._last_flush = time.monotonic()
+
+    def append(self, info_dict):
+        append_card_row(self.ws, info_dict)
+        self._pending_rows += 1
+        if (self._pending_rows >= self.flush_every_rows
+                or time.monotonic() - self._last_flush >= self.flush_every_seconds):
+            self.flush()
 
-    os.chdir(directory)
+    def flush(self):
+        if self._pending_rows:
+            self.saved_path = save_workbook(self.wb, self.full_path)
+            self._pending_rows = 0
+        self._last_flush = time.monotonic()
+        return self.saved_path
 
-    port = 8000
-    handler = http.server.SimpleHTTPRequestHandler
+    def close(self):
+        return self.flush()
 
-    def run_server():
-        with socketserver.TCPServer(("", port), handler) as httpd:
-            print(f"Serving file at http://localhost:{port}/{filename}")
-            httpd.serve_forever()
+    def __enter__(self):
+        return self
 
-    server_thread = threading.Thread(target=run_server)
-    server_thread.daemon = True
-    server_thread.start()
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-    webbrowser.open(f"http://localhost:{port}/{filename}")
+
+def save_to_excel(info_dict, file_name="business_card_output.xlsx"):
+    try:
+        with ExcelBatchWriter(get_output_path(file_name)) as writer:
+            writer.append(info_dict)
+    except Exception as e:
+        print(f"Error saving file: {e}")
+        return None
+    return writer.saved_path
+
+
+download_servers = []
+
+
+def serve_file_for_download(file_path):
+    import webbrowser
+    from tkinter import messagebox
+    from download_server import FileDownloadServer
+
+    stop_download_servers()
+    server = FileDownloadServer(file_path).start()
+    download_servers.append(server)
+    print(f"Serving file at {server.url}")
+
+    webbrowser.open(server.url)
 
     messagebox.showinfo("Download Available",
                             f"Your file is available for download.\n\n"
                             f"It has also been saved to: {file_path}")
 
-    time.sleep(5)
-    print("Download server shutting down...")
+
+def stop_download_servers():
+    while download_servers:
+        download_servers.pop().shutdown()
 
 
 def open_file_location(file_path):
+    from tkinter import messagebox
+
     if os.path.exists(file_path):
         directory = os.path.dirname(file_path)
         if os.name == 'nt':
@@ -234,17 +201,35 @@ def open_file_location(file_path):
         messagebox.showerror("Error", f"File not found: {file_path}")
 
 
+def run_extraction_batch(file_paths, results, cancel_event):
+    # On cancel, cards already sent to the API are still delivered and saved; queued ones never start.
+    for file_path, info, error in imap_ordered(extract_info_from_image, file_paths, MAX_WORKERS, cancel_event):
+        results.put(("card", file_path, info))
+    results.put(("done", None, None))
+
+
+def format_eta(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
+
+
 def process_multiple_cards():
+    # The GUI toolkit is only loaded when the window is actually opened.
+    from tkinter import Tk, filedialog, messagebox, ttk, Button, Label, Frame
+
     root = Tk()
     root.title("Business Card Extractor")
-    root.geometry("500x300")
+    root.geometry("500x380")
 
     excel_path = None
     processed_count = 0
     processed_files = set()
+    results = queue.Queue()
+    cancel_event = threading.Event()
+    batch = {}
 
     def select_and_process():
-        nonlocal excel_path, processed_count, processed_files
+        nonlocal excel_path
 
         file_paths = filedialog.askopenfilenames(
             title="Select Business Card Images",
@@ -254,6 +239,7 @@ def process_multiple_cards():
         if not file_paths:
             return
 
+        pending = []
         for file_path in file_paths:
             if file_path in processed_files:
                 print(f"Skipping already processed file: {os.path.basename(file_path)}")
@@ -263,22 +249,75 @@ def process_multiple_cards():
                 messagebox.showerror("Error", f"File not found: {file_path}")
                 continue
 
-            status_label.config(text=f"Processing: {os.path.basename(file_path)}...")
-            root.update()
+            pending.append(file_path)
 
-            print(f"Processing: {file_path}")
-            info = extract_info_from_image(file_path)
+        if not pending:
+            return
 
-            if info:
-                excel_path = save_to_excel(info)
-                processed_count += 1
-                processed_files.add(file_path)
-                status_label.config(text=f"Processed {processed_count} card(s). Last: {os.path.basename(file_path)}")
-            else:
-                status_label.config(text=f"Failed to process: {os.path.basename(file_path)}")
+        output_path = get_output_path()
+        try:
+            writer = ExcelBatchWriter(output_path)
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not open {output_path}: {e}")
+            return
+
+        batch.update(writer=writer, total=len(pending), done=0, started=time.monotonic())
+        cancel_event.clear()
+        progress_bar.config(maximum=len(pending), value=0)
+        select_button.config(state="disabled")
+        cancel_button.config(state="normal")
+        status_label.config(text=f"Processing {len(pending)} card(s)...")
+
+        threading.Thread(target=run_extraction_batch, args=(pending, results, cancel_event), daemon=True).start()
+        root.after(POLL_INTERVAL_MS, poll_results)
+
+    def handle_card(file_path, info):
+        nonlocal excel_path, processed_count
+
+        batch["done"] += 1
+        if info:
+            batch["writer"].append(info)
+            excel_path = batch["writer"].saved_path or excel_path
+            processed_count += 1
+            processed_files.add(file_path)
+            status_text = f"Processed {processed_count} card(s). Last: {os.path.basename(file_path)}"
+        else:
+            status_text = f"Failed to process: {os.path.basename(file_path)}"
+
+        elapsed = time.monotonic() - batch["started"]
+        remaining = batch["total"] - batch["done"]
+        progress_bar.config(value=batch["done"])
+        progress_label.config(text=f"{batch['done']}/{batch['total']} - ETA {format_eta(elapsed / batch['done'] * remaining)}")
+        status_label.config(text=status_text)
 
+    def finish_batch():
+        nonlocal excel_path
+
+        excel_path = batch["writer"].close() or excel_path
+        select_button.config(state="normal")
+        cancel_button.config(state="disabled")
+        if cancel_event.is_set():
+            status_label.config(text=f"Cancelled after {batch['done']} of {batch['total']} card(s).")
+        progress_label.config(text=f"{batch['done']}/{batch['total']} done")
         download_button.config(state="normal" if excel_path else "disabled")
 
+    def poll_results():
+        while True:
+            try:
+                kind, file_path, info = results.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "done":
+                finish_batch()
+                return
+            handle_card(file_path, info)
+        root.after(POLL_INTERVAL_MS, poll_results)
+
+    def cancel_batch():
+        cancel_event.set()
+        cancel_button.config(state="disabled")
+        status_label.config(text="Cancelling after the cards already in flight...")
+
     def download_file():
         nonlocal excel_path
         if not excel_path:
@@ -297,6 +336,10 @@ def process_multiple_cards():
             serve_file_for_download(excel_path)
 
     def exit_app():
+        cancel_event.set()
+        if batch.get("writer"):
+            batch["writer"].close()
+        stop_download_servers()
         root.destroy()
 
     frame = Frame(root, padx=20, pady=20)
@@ -304,15 +347,25 @@ def process_multiple_cards():
 
     Label(frame, text="Business Card Information Extractor", font=("Arial", 14, "bold")).pack(pady=10)
 
-    Button(frame, text="Select Card Image(s)", command=select_and_process, width=20).pack(pady=10)
+    select_button = Button(frame, text="Select Card Image(s)", command=select_and_process, width=20)
+    select_button.pack(pady=10)
+
+    progress_bar = ttk.Progressbar(frame, orient="horizontal", length=400, mode="determinate")
+    progress_bar.pack(pady=5)
+
+    progress_label = Label(frame, text="")
+    progress_label.pack()
 
     status_label = Label(frame, text="Ready to process business cards...", wraplength=450)
     status_label.pack(pady=10)
 
+    cancel_button = Button(frame, text="Cancel", command=cancel_batch, state="disabled", width=20)
+    cancel_button.pack(pady=5)
+
     download_button = Button(frame, text="Download Excel File", command=download_file, state="disabled", width=20)
-    download_button.pack(pady=10)
+    download_button.pack(pady=5)
 
-    Button(frame, text="Exit", command=exit_app, width=20).pack(pady=10)
+    Button(frame, text="Exit", command=exit_app, width=20).pack(pady=5)
 
     root.mainloop()
 
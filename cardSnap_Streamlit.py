@@ -1,254 +1,291 @@
 import streamlit as st
-import requests
-import base64
-import json
-import os
-import openpyxl
 from pathlib import Path
 import hashlib
-import io
-import zipfile
-from PIL import Image
+import threading
+from functools import partial
+import metrics
+from dedup import DEFAULT_MERGE_THRESHOLD
+from extraction import extract_batch, iter_zip_cards
+from exporters import EXPORTERS, MIME_TYPES, export_master
+from extraction_cache import DEFAULT_MAX_BYTES, ExtractionCache
+from gemini_client import DEFAULT_BASE_URL, DEFAULT_MODEL, GeminiClient
+from image_prep import DEFAULT_FORMAT, DEFAULT_MAX_DIMENSION, DEFAULT_QUALITY
+from job_queue import ADDED, DUPLICATE, JobQueue, JobWorker
+from local_ocr import DEFAULT_MIN_CONFIDENCE, MODE_OFF, MODE_OFFLINE
+from master_store import DEFAULT_NAMESPACE, MasterStore, namespace_slug, to_master_row
+from pipeline import DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_SECOND, get_host_limiter
+from scheduler import BULK, DEFAULT_INPUT_PRICE_PER_MILLION, DEFAULT_LATENCY_TARGET, DEFAULT_OUTPUT_PRICE_PER_MILLION, INTERACTIVE, AdaptiveScheduler, UsageTracker
 
 API_KEY = st.secrets["API_KEY"]
-HEADERS = {"Content-Type": "application/json"}
 MASTER_EXCEL_FILE = "business_cards_master.xlsx"
+MASTER_STORE_FILE = "business_cards_master.db"
+HASH_CHUNK_SIZE = 1024 * 1024
+MODEL = st.secrets.get("MODEL", DEFAULT_MODEL)
+EXTRACTION_CACHE_FILE = "extraction_cache.db"
+JOB_QUEUE_FILE = "job_queue.db"
+SPOOL_DIR = "spool"
+JOB_HISTORY_LIMIT = 5
+EXTRACTION_CACHE_MAX_BYTES = int(st.secrets.get("EXTRACTION_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+IMAGE_MAX_DIMENSION = int(st.secrets.get("IMAGE_MAX_DIMENSION", DEFAULT_MAX_DIMENSION))
+IMAGE_QUALITY = int(st.secrets.get("IMAGE_QUALITY", DEFAULT_QUALITY))
+IMAGE_FORMAT = st.secrets.get("IMAGE_FORMAT", DEFAULT_FORMAT)
+BATCH_SIZE = max(1, int(st.secrets.get("BATCH_SIZE", 1)))
+MERGE_THRESHOLD = float(st.secrets.get("MERGE_THRESHOLD", DEFAULT_MERGE_THRESHOLD))
+NAMESPACE = st.secrets.get("NAMESPACE", DEFAULT_NAMESPACE)
+LOCAL_OCR_MODE = st.secrets.get("LOCAL_OCR_MODE", MODE_OFF)
+LOCAL_OCR_MIN_CONFIDENCE = float(st.secrets.get("LOCAL_OCR_MIN_CONFIDENCE", DEFAULT_MIN_CONFIDENCE))
+MAX_WORKERS = int(st.secrets.get("MAX_WORKERS", DEFAULT_MAX_WORKERS))
+REQUESTS_PER_SECOND = float(st.secrets.get("REQUESTS_PER_SECOND", DEFAULT_REQUESTS_PER_SECOND))
+LATENCY_TARGET = float(st.secrets.get("LATENCY_TARGET", DEFAULT_LATENCY_TARGET))
+INPUT_PRICE_PER_MILLION = float(st.secrets.get("INPUT_PRICE_PER_MILLION", DEFAULT_INPUT_PRICE_PER_MILLION))
+OUTPUT_PRICE_PER_MILLION = float(st.secrets.get("OUTPUT_PRICE_PER_MILLION", DEFAULT_OUTPUT_PRICE_PER_MILLION))
+METRICS_FILE = st.secrets.get("METRICS_FILE")
+METRICS_PORT = int(st.secrets.get("METRICS_PORT", 0))
+METRICS_REFRESH_SECONDS = 2
 
 if 'processed_files' not in st.session_state:
     st.session_state.processed_files = set()
 
-def get_file_hash(file_content):
-    return hashlib.md5(file_content).hexdigest()
-
-def encode_image(image_path):
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
-
-def extract_info_from_image(image_path):
-    url = f"https://generativelanguage.googleapis.com/v1/models/gemini-1.5-flash:generateContent?key={API_KEY}"
-    prompt = {
-        "contents": [
-            {
-                "parts": [
-                    {
-                        "text": "Extract the Company Name, Person's Name, Designation, Phone, Email, Website, and Address from this business card. Respond only with JSON format. Use exactly these field names: 'Company Name', 'Person Name', 'Designation', 'Phone', 'Email', 'Website', 'Address'. Do NOT use triple backticks or markdown."
-                    },
-                    {
-                        "inlineData": {
-                            "mimeType": "image/jpeg",
-                            "data": encode_image(image_path)
-                        }
-                    }
-                ]
-            }
-        ]
-    }
-    response = requests.post(url, headers=HEADERS, data=json.dumps(prompt))
-    if response.status_code == 200:
+def get_stream_hash(stream, chunk_size=HASH_CHUNK_SIZE):
+    digest = hashlib.md5()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+@st.cache_resource
+def get_master_store(namespace=NAMESPACE):
+    store = MasterStore(Path.cwd() / "documents" / MASTER_STORE_FILE, MERGE_THRESHOLD, namespace=namespace)
+    legacy_excel_path = Path.cwd() / "documents" / MASTER_EXCEL_FILE
+    if namespace == DEFAULT_NAMESPACE and store.count() == 0 and legacy_excel_path.is_file():
+        store.import_xlsx(legacy_excel_path)
+    return store
+
+def current_namespace():
+    return st.session_state.get("namespace", NAMESPACE).strip()
+
+@st.cache_resource
+def get_extraction_cache():
+    return ExtractionCache(Path.cwd() / "documents" / EXTRACTION_CACHE_FILE, EXTRACTION_CACHE_MAX_BYTES)
+
+@st.cache_resource
+def get_gemini_client():
+    return GeminiClient(
+        API_KEY,
+        model=MODEL,
+        rate_limiter=get_host_limiter(DEFAULT_BASE_URL, REQUESTS_PER_SECOND, factory=partial(AdaptiveScheduler, max_concurrency=MAX_WORKERS, latency_target=LATENCY_TARGET)),
+        pool_size=MAX_WORKERS,
+        usage=UsageTracker(INPUT_PRICE_PER_MILLION, OUTPUT_PRICE_PER_MILLION),
+    )
+
+@st.cache_resource
+def start_metrics_server():
+    return metrics.serve_metrics(METRICS_PORT) if METRICS_PORT else None
+
+def save_card(stores, info_dict, file_name, namespace):
+    # The worker thread keeps its own store connections; SQLite serializes them with the sessions' writes.
+    store = stores.get(namespace)
+    if store is None:
+        store = stores[namespace] = MasterStore(Path.cwd() / "documents" / MASTER_STORE_FILE, MERGE_THRESHOLD, namespace=namespace)
+    return ADDED if store.add(to_master_row(info_dict, file_name)) else DUPLICATE
+
+@st.cache_resource
+def get_job_queue():
+    return JobQueue(Path.cwd() / "documents" / JOB_QUEUE_FILE, Path.cwd() / "documents" / SPOOL_DIR)
+
+@st.cache_resource
+def get_job_worker():
+    # One worker per server process; resources are resolved here, on the script thread, not in the worker.
+    client = get_gemini_client()
+    extract = partial(extract_batch, client=client, cache=get_extraction_cache(), max_dimension=IMAGE_MAX_DIMENSION, quality=IMAGE_QUALITY, image_format=IMAGE_FORMAT, local_mode=LOCAL_OCR_MODE, local_min_confidence=LOCAL_OCR_MIN_CONFIDENCE)
+    # The metrics file is written by the worker, so it stays current with no browser tab open.
+    write_metrics = partial(metrics.REGISTRY.write, METRICS_FILE) if METRICS_FILE else None
+    return JobWorker(get_job_queue(), extract, partial(save_card, {}), BATCH_SIZE, MAX_WORKERS, usage=client.usage,
+                     after_batch=write_metrics).start()
+
+def enqueue_uploads(uploaded_files):
+    """Spool new uploads into one job; uploads seen earlier in this session are not re-read on reruns."""
+    new_files = []
+    for uploaded_file in uploaded_files:
+        upload_hash = get_stream_hash(uploaded_file)
+        if upload_hash not in st.session_state.processed_files:
+            new_files.append((upload_hash, uploaded_file))
+    if not new_files:
+        return 0
+
+    queue = get_job_queue()
+    # A single card is someone waiting on the page; it goes ahead of queued ZIP and multi-file imports.
+    interactive = len(new_files) == 1 and not new_files[0][1].name.endswith(".zip")
+    job_id = queue.create_job(", ".join(uploaded_file.name for _, uploaded_file in new_files), current_namespace(),
+                              INTERACTIVE if interactive else BULK)
+    queued = 0
+    for file_content, file_name in iter_uploaded_cards(uploaded_file for _, uploaded_file in new_files):
+        if queue.enqueue(job_id, file_content, file_name):
+            queued += 1
+        else:
+            st.info(f"Skipping already processed file: {file_name}")
+    st.session_state.processed_files.update(upload_hash for upload_hash, _ in new_files)
+    get_job_worker().wake()
+    return queued
+
+# Older Streamlit releases have no fragments; the panel then refreshes with each rerun.
+live_fragment = st.fragment(run_every=METRICS_REFRESH_SECONDS) if hasattr(st, "fragment") else (lambda fn: fn)
+
+@live_fragment
+def render_job_status():
+    queue = get_job_queue()
+    jobs = queue.jobs(JOB_HISTORY_LIMIT, current_namespace())
+    for job in jobs:
+        progress = job["finished"] / job["total"] if job["total"] else 1.0
+        summary = f"{job['finished']}/{job['total']} cards, {job['added']} added, {job['duplicates']} duplicates, {job['failed']} failed, ~{job['tokens']} tokens (${job['estimated_cost']:.4f})"
+        if LOCAL_OCR_MODE == MODE_OFFLINE:
+            summary += f", {job['api_calls_avoided']} API calls avoided"
+        st.progress(progress, text=f"{job['name']}: {summary}")
+        if job["uploaded_bytes"]:
+            with st.expander(f"Uploaded {job['uploaded_bytes'] / 1024:.0f} KB, saved {job['bytes_saved'] / 1024:.0f} KB in job {job['id']}"):
+                for file_name, uploaded_bytes, bytes_saved in queue.uploads(job["id"]):
+                    st.caption(f"{file_name}: uploaded {uploaded_bytes / 1024:.0f} KB, saved {bytes_saved / 1024:.0f} KB")
+        if job["failed"]:
+            with st.expander(f"Errors in job {job['id']}"):
+                for file_name, error in queue.errors(job["id"]):
+                    st.error(f"Error processing {file_name}: {error}")
+
+@st.cache_resource
+def get_rededupe_runs():
+    # Per-namespace duplicate-removal passes, shared by every session on this server process.
+    return {}
+
+def start_rededupe(namespace):
+    """Run MasterStore.rededupe for a namespace on a background thread. Returns False if one is already running."""
+    runs = get_rededupe_runs()
+    run = runs.get(namespace)
+    if run and run["thread"].is_alive():
+        return False
+    store = get_master_store(namespace)
+    run = runs[namespace] = {"done": 0, "total": store.count(), "removed": 0, "error": None}
+
+    def progress(done, total, removed):
+        run.update(done=done, total=total, removed=removed)
+
+    def work():
         try:
-            data = response.json()
-            extracted_text = data['candidates'][0]['content']['parts'][0]['text']
-            for marker in ["```json", "```"]:
-                extracted_text = extracted_text.replace(marker, "").strip()
-            return json.loads(extracted_text)
+            run["removed"] = store.rededupe(progress=progress)
         except Exception as e:
-            st.error(f"Error processing image: {e}")
-            return None
+            run["error"] = e
+
+    run["thread"] = threading.Thread(target=work, name="cardsnap-rededupe", daemon=True)
+    run["thread"].start()
+    return True
+
+@live_fragment
+def render_rededupe_status():
+    run = get_rededupe_runs().get(current_namespace())
+    if not run:
+        return
+    if run["thread"].is_alive():
+        progress = run["done"] / run["total"] if run["total"] else 0.0
+        st.progress(progress, text=f"Removing duplicates: {run['done']}/{run['total']} contacts checked, {run['removed']} removed")
+    elif run["error"]:
+        st.error(f"Error removing duplicates: {run['error']}")
     else:
-        st.error(f"API Error: {response.status_code} - {response.text}")
-        return None
-
-def normalize_fields(info_dict):
-    field_mapping = {
-        "company name": "Company Name",
-        "company's name": "Company Name",
-        "company": "Company Name",
-        "person's name": "Person Name",
-        "person name": "Person Name",
-        "name": "Person Name",
-        "person": "Person Name",
-        "full name": "Person Name",
-        "designation": "Designation",
-        "title": "Designation",
-        "job title": "Designation",
-        "position": "Designation",
-        "role": "Designation",
-        "phone": "Phone",
-        "phone number": "Phone",
-        "mobile": "Phone",
-        "telephone": "Phone",
-        "tel": "Phone",
-        "contact": "Phone",
-        "email": "Email",
-        "mail": "Email",
-        "e-mail": "Email",
-        "email address": "Email",
-        "website": "Website",
-        "web": "Website",
-        "url": "Website",
-        "site": "Website",
-        "web address": "Website",
-        "address": "Address",
-        "location": "Address",
-        "office": "Address",
-        "office address": "Address",
-    }
-    normalized_data = {}
-    for field, value in info_dict.items():
-        normalized_field = field.lower().replace("'", "").strip()
-        standard_field = next((std_field for key, std_field in field_mapping.items() if normalized_field == key or key in normalized_field), field)
-        normalized_data[standard_field] = value
-    return normalized_data
-
-def save_to_master_excel(info_dict, file_name):
-    documents_path = Path.cwd() / "documents"
-    documents_path.mkdir(exist_ok=True)
-    full_path = documents_path / MASTER_EXCEL_FILE
-    headers = ["File Name", "Company Name", "Person Name", "Designation", "Phone", "Email", "Website", "Address"]
-    normalized_data = normalize_fields(info_dict)
-    
-
-    new_row = [file_name]
-    for header in headers[1:]:  # Skip "File Name" as we already added it
-        new_row.append(normalized_data.get(header, ""))
-
-    try:
-        if full_path.is_file():
-            wb = openpyxl.load_workbook(full_path)
-            ws = wb.active
-            
-            existing_rows = []
-            for row in ws.iter_rows(min_row=2, values_only=True):
-                row_values = tuple(str(cell).strip() if cell is not None else "" for cell in row)
-                existing_rows.append(row_values)
-            
-            new_row_tuple = tuple(str(cell).strip() if cell is not None else "" for cell in new_row)
-            
-            is_duplicate = False
-            for existing_row in existing_rows:
-        
-                email_match = (existing_row[5].lower() == new_row_tuple[5].lower()) and new_row_tuple[5] != ""
-                phone_match = (existing_row[4].lower() == new_row_tuple[4].lower()) and new_row_tuple[4] != ""
-                name_match = (existing_row[2].lower() == new_row_tuple[2].lower()) and new_row_tuple[2] != ""
-                
-                if (email_match or phone_match) and name_match:
-                    is_duplicate = True
-                    break
-                
-                if existing_row[1:] == new_row_tuple[1:]:
-                    is_duplicate = True
-                    break
-            
-            if not is_duplicate:
-                ws.append(new_row)
-                wb.save(full_path)
-                return str(full_path), True
-            else:
-                return str(full_path), False
+        st.success(f"Removed {run['removed']} duplicate contact(s) from the master list.")
+
+@live_fragment
+def render_metrics_panel():
+    snapshot = metrics.REGISTRY.snapshot()
+    with st.expander("Pipeline metrics"):
+        stages = snapshot["stages"]
+        rows = [
+            {"Stage": stage, "Count": stages[stage]["count"], "Mean (ms)": round(1000 * stages[stage]["mean_s"], 1),
+             "p50 (ms)": 1000 * stages[stage]["p50_s"], "p95 (ms)": 1000 * stages[stage]["p95_s"],
+             "Total (s)": round(stages[stage]["total_s"], 2)}
+            for stage in metrics.STAGES if stage in stages
+        ]
+        if rows:
+            st.table(rows)
+        counters = snapshot["counters"]
+        if counters:
+            st.table([{"Counter": name, "Value": value} for name, value in sorted(counters.items())])
+        if not (rows or counters):
+            st.caption("No cards processed yet.")
+
+def iter_uploaded_cards(uploaded_files):
+    import zipfile
+
+    for uploaded_file in uploaded_files:
+        file_name = uploaded_file.name
+
+        if file_name.endswith(".zip"):
+            try:
+                with zipfile.ZipFile(uploaded_file, 'r') as zip_ref:
+                    yield from iter_zip_cards(zip_ref)
+            except zipfile.BadZipFile:
+                st.error(f"Error: '{file_name}' is not a valid ZIP file.")
+            except Exception as e:
+                st.error(f"Error processing '{file_name}': {e}")
         else:
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = "Business Cards"
-            ws.append(headers)
-            ws.append(new_row)
-            
-            # Format the sheet
-            for col in range(1, len(headers) + 1):
-                ws.cell(row=1, column=col).font = openpyxl.styles.Font(bold=True)
-                ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = 20
-            
-            wb.save(full_path)
-            return str(full_path), True
-    except Exception as e:
-        st.error(f"Failed to save data: {e}")
-        return None, False
-
-def process_file(file_content, file_name):
-    try:
-        file_hash = get_file_hash(file_content)
-        if file_hash in st.session_state.processed_files:
-            st.info(f"Skipping already processed file: {file_name}")
-            return True, False
-
-        img = Image.open(io.BytesIO(file_content))
-        temp_path = os.path.join("uploaded_cards", file_name)
-        os.makedirs("uploaded_cards", exist_ok=True)
-        img.save(temp_path)
-
-        with st.spinner(f"Processing {file_name}..."):
-            info = extract_info_from_image(temp_path)
-            if info:
-                saved_path, is_new = save_to_master_excel(info, file_name)
-                if saved_path:
-                    if is_new:
-                        st.success(f"Data from '{file_name}' added to master Excel file!")
-                    else:
-                        st.info(f"Data from '{file_name}' already exists in the master Excel file.")
-                    st.session_state.processed_files.add(file_hash)
-                    os.remove(temp_path)
-                    return True, is_new
-            
-            st.session_state.processed_files.add(file_hash)
-
-        os.remove(temp_path)
-        return True, False
-    except Exception as e:
-        st.error(f"Error processing {file_name}: {e}")
-        return False, False
+            yield uploaded_file.getvalue(), file_name
 
 def main():
     st.set_page_config(page_title="CardSnap", layout="centered")
     st.title("Welcome to cardSnap")
     st.write("Upload one or more business card images (PNG, JPG, JPEG) or a ZIP file of images. We'll extract the contact info and save it to a single Excel file!")
+    start_metrics_server()
+    # start() is idempotent and restarts a worker thread that has died since the resource was cached.
+    get_job_worker().start()
+    st.sidebar.text_input("Team", value=NAMESPACE, key="namespace", help="Each team keeps its own master list in the shared store.")
 
     if st.button("Clear processed files history"):
         st.session_state.processed_files = set()
+        get_job_queue().forget_finished(current_namespace())
         st.success("Processing history cleared! All uploaded files will be processed again.")
 
+    if st.button("Remove duplicates from master list"):
+        if not start_rededupe(current_namespace()):
+            st.info("Duplicates are already being removed from this master list.")
+    render_rededupe_status()
+
     uploaded_files = st.file_uploader("Upload Business Card Images or ZIP file", type=["png", "jpg", "jpeg", "zip"], accept_multiple_files=True)
 
     if uploaded_files:
-        new_entries_added = False
-        for uploaded_file in uploaded_files:
-            file_name = uploaded_file.name
-            file_content = uploaded_file.read()
-
-            if file_name.endswith(".zip"):
-                try:
-                    zip_hash = get_file_hash(file_content)
-                    if zip_hash in st.session_state.processed_files:
-                        st.info(f"Skipping already processed ZIP file: {file_name}")
-                        continue
-
-                    with zipfile.ZipFile(io.BytesIO(file_content), 'r') as zip_ref:
-                        for member in zip_ref.namelist():
-                            if member.lower().endswith(('.png', '.jpg', '.jpeg')):
-                                with zip_ref.open(member) as image_file:
-                                    image_content = image_file.read()
-                                    success, is_new = process_file(image_content, os.path.basename(member))
-                                    new_entries_added = new_entries_added or is_new
-                    st.session_state.processed_files.add(zip_hash)
-                except zipfile.BadZipFile:
-                    st.error(f"Error: '{file_name}' is not a valid ZIP file.")
-                except Exception as e:
-                    st.error(f"Error processing '{file_name}': {e}")
-            else:
-                success, is_new = process_file(file_content, file_name)
-                new_entries_added = new_entries_added or is_new
-
-        master_excel_path = Path.cwd() / "documents" / MASTER_EXCEL_FILE
-        if master_excel_path.exists():
-            with open(master_excel_path, "rb") as f:
+        queued = enqueue_uploads(uploaded_files)
+        if queued:
+            st.success(f"Queued {queued} card(s). They are processed in the background and survive page reloads.")
+
+    render_job_status()
+
+    if uploaded_files or get_job_queue().jobs(1, current_namespace()):
+        store = get_master_store(current_namespace())
+        if store.count():
+            export_format = st.selectbox("Export format", list(EXPORTERS), key="export_format")
+            export_stem = "_".join(filter(None, [Path(MASTER_EXCEL_FILE).stem, namespace_slug(current_namespace())]))
+            export_name = f"{export_stem}.{export_format}"
+            if st.button("Prepare Export"):
+                st.session_state.master_export = export_master(store, Path.cwd() / "documents" / export_name)
+            if st.session_state.get("master_export", "").endswith(export_name):
+                # Streamlit reads any file object it is given and keeps the bytes in its media
+                # manager, so the download is buffered in memory either way; only the export
+                # itself is streamed. Read it explicitly so that cost is visible here.
+                export_path = Path(st.session_state.master_export)
                 st.download_button(
-                    label=f"Download Excel Sheet",
-                    data=f.read(),
-                    file_name=MASTER_EXCEL_FILE,
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                    label=f"Download {export_format.upper()} ({export_path.stat().st_size / 1024:.0f} KB)",
+                    data=export_path.read_bytes(),
+                    file_name=export_name,
+                    mime=MIME_TYPES[export_format],
                     key="download_master"
                 )
 
-        if st.session_state.processed_files:
-            st.write(f"Currently processed {len(st.session_state.processed_files)} unique files.")
+        api_stats = get_gemini_client().stats()
+        st.caption(f"API: {api_stats['requests']} requests, {api_stats['retries']} retries, p50 {api_stats['latency_p50']:.2f}s, p95 {api_stats['latency_p95']:.2f}s.")
+        usage, scheduler_stats = api_stats["usage"], api_stats.get("scheduler")
+        st.caption(f"Spend: {usage['input_tokens']} input tokens ({usage['image_tokens']} image), {usage['output_tokens']} output tokens, ~${usage['estimated_cost']:.4f}.")
+        if scheduler_stats:
+            st.caption(f"Scheduler: {scheduler_stats['concurrency_limit']} concurrent, {scheduler_stats['requests_per_second']:.2f} requests/s, throttled {scheduler_stats['throttled']} times.")
+        cache_stats = get_extraction_cache().stats()
+        st.caption(f"Extraction cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['entries']} cached cards.")
+
+    render_metrics_panel()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
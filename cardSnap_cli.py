@@ -0,0 +1,255 @@
+import argparse
+import glob
+import os
+import sys
+import time
+import zipfile
+from functools import partial
+from pathlib import Path
+
+from dedup import DEFAULT_MERGE_THRESHOLD
+from exporters import export_master
+from extraction import IMAGE_EXTENSIONS, extract_batch, get_file_hash, iter_zip_cards
+from extraction_cache import DEFAULT_MAX_BYTES, ExtractionCache
+from gemini_client import DEFAULT_BASE_URL, DEFAULT_MODEL, GeminiClient, percentile
+from image_prep import DEFAULT_FORMAT, DEFAULT_MAX_DIMENSION, DEFAULT_QUALITY
+from local_ocr import DEFAULT_MIN_CONFIDENCE, MODE_OFF, MODE_OFFLINE, MODES as LOCAL_OCR_MODES, is_available as local_ocr_available
+from master_store import DEFAULT_NAMESPACE, MasterStore, namespace_slug, to_master_row
+from metrics import REGISTRY as METRICS, serve_metrics
+from pipeline import DEFAULT_MAX_WORKERS, DEFAULT_REQUESTS_PER_SECOND, imap_ordered, iter_batches
+from scheduler import (DEFAULT_INPUT_PRICE_PER_MILLION, DEFAULT_LATENCY_TARGET, DEFAULT_OUTPUT_PRICE_PER_MILLION,
+                       AdaptiveScheduler, UsageTracker)
+
+DOCUMENTS_PATH = Path.cwd() / "documents"
+PROGRESS_EVERY = 100
+
+
+def iter_source_cards(source, on_error):
+    """Yield (file_content, file_name) for every card under source; unreadable files and archives go to on_error."""
+    path = Path(source)
+    if path.is_file() and path.suffix.lower() == ".zip":
+        try:
+            zip_ref = zipfile.ZipFile(path, "r")
+        except Exception as e:
+            on_error(path.name, e)
+            return
+        with zip_ref:
+            yield from iter_zip_cards(zip_ref, on_error)
+        return
+
+    if path.is_dir():
+        paths = (p for p in sorted(path.rglob("*")) if p.is_file())
+    elif path.is_file():
+        paths = [path]
+    else:
+        paths = (Path(p) for p in sorted(glob.iglob(source, recursive=True)))
+
+    for image_path in paths:
+        if image_path.suffix.lower() == ".zip":
+            yield from iter_source_cards(str(image_path), on_error)
+        elif image_path.suffix.lower() in IMAGE_EXTENSIONS:
+            try:
+                file_content = image_path.read_bytes()
+            except OSError as e:
+                on_error(image_path.name, e)
+                continue
+            yield file_content, image_path.name
+
+
+def default_checkpoint_path(store_path, namespace):
+    # One checkpoint per store and namespace, so importing into another store or team starts fresh.
+    store_path = Path(store_path)
+    stem = ".".join(filter(None, [store_path.stem, namespace_slug(namespace)]))
+    return store_path.with_name(f"{stem}.checkpoint.txt")
+
+
+def load_checkpoint(checkpoint_path):
+    if not checkpoint_path.is_file():
+        return set()
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def iter_pending_cards(sources, completed, stats):
+    seen = set()
+
+    def on_error(file_name, error):
+        # An unreadable file or archive is a failed card, not the end of an overnight import.
+        stats["failed"] += 1
+        print(f"Error reading {file_name}: {error}", file=sys.stderr)
+
+    for source in sources:
+        for file_content, file_name in iter_source_cards(source, on_error):
+            file_hash = get_file_hash(file_content)
+            if file_hash in completed or file_hash in seen:
+                stats["skipped"] += 1
+                continue
+            seen.add(file_hash)
+            yield file_hash, file_content, file_name
+
+
+def timed(fn, *args, **kwargs):
+    started = time.monotonic()
+    result = fn(*args, **kwargs)
+    return result, time.monotonic() - started
+
+
+def print_throughput(stats, latencies, started, out=sys.stderr):
+    elapsed = max(time.monotonic() - started, 1e-9)
+    print(
+        f"{stats['processed']} cards in {elapsed:.1f}s ({stats['processed'] / elapsed:.2f} cards/sec), "
+        f"p50 {percentile(latencies, 0.50):.2f}s, p95 {percentile(latencies, 0.95):.2f}s, "
+        f"{stats['added']} added, {stats['duplicates']} duplicates, {stats['failed']} failed, {stats['skipped']} skipped",
+        file=out,
+    )
+
+
+def print_usage(api_stats, out=sys.stderr):
+    usage, scheduler_stats = api_stats["usage"], api_stats["scheduler"]
+    print(
+        f"Spend: {usage['input_tokens']} input tokens ({usage['image_tokens']} image), {usage['output_tokens']} output tokens, "
+        f"~${usage['estimated_cost']:.4f}; scheduler at {scheduler_stats['concurrency_limit']} concurrent, "
+        f"{scheduler_stats['requests_per_second']:.2f} requests/s, throttled {scheduler_stats['throttled']} times",
+        file=out,
+    )
+
+
+def rededupe(args):
+    removed = MasterStore(args.store, args.merge_threshold, namespace=args.namespace).rededupe()
+    print(f"Removed {removed} duplicate contact(s) from {args.store}")
+    return 0
+
+
+def export(args):
+    path = export_master(MasterStore(args.store, args.merge_threshold, namespace=args.namespace), args.export)
+    print(f"Exported master store to {path}")
+    return 0
+
+
+def run(args):
+    api_key = os.getenv("API_KEY")
+    if not api_key and args.local_ocr != MODE_OFFLINE:
+        print("API_KEY is not set.", file=sys.stderr)
+        return 2
+    if args.local_ocr != MODE_OFF and not local_ocr_available():
+        print("Local OCR needs the pytesseract package and the tesseract binary.", file=sys.stderr)
+        return 2
+
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    client = GeminiClient(api_key, model=args.model, base_url=args.base_url, pool_size=args.workers,
+                          rate_limiter=AdaptiveScheduler(args.requests_per_second, args.workers, latency_target=args.latency_target),
+                          usage=UsageTracker(args.input_price, args.output_price))
+    cache = None if args.no_cache else ExtractionCache(args.cache, DEFAULT_MAX_BYTES)
+    store = MasterStore(args.store, args.merge_threshold, namespace=args.namespace)
+    checkpoint_path = Path(args.checkpoint) if args.checkpoint else default_checkpoint_path(args.store, args.namespace)
+    checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+    completed = load_checkpoint(checkpoint_path)
+
+    stats = {"processed": 0, "added": 0, "duplicates": 0, "failed": 0, "skipped": 0, "api_calls_avoided": 0}
+    latencies = []
+    started = time.monotonic()
+    extract = partial(timed, extract_batch, client=client, cache=cache, max_dimension=args.max_dimension,
+                      quality=args.quality, image_format=args.image_format, local_mode=args.local_ocr,
+                      local_min_confidence=args.local_min_confidence)
+    batches = iter_batches(iter_pending_cards(args.sources, completed, stats), args.batch_size)
+
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        for batch, result, batch_error in imap_ordered(extract, batches, args.workers):
+            results, elapsed = result if result else ([(None, {}, batch_error)] * len(batch), 0.0)
+            for (file_hash, _, file_name), (info, card_stats, error) in zip(batch, results):
+                stats["processed"] += 1
+                latencies.append(elapsed)
+                if card_stats.get("source") == "local":
+                    stats["api_calls_avoided"] += 1
+                if error:
+                    stats["failed"] += 1
+                    print(f"Error processing {file_name}: {error}", file=sys.stderr)
+                    continue
+                if info:
+                    if store.add(to_master_row(info, file_name)):
+                        stats["added"] += 1
+                    else:
+                        stats["duplicates"] += 1
+                checkpoint.write(file_hash + "\n")
+            checkpoint.flush()
+            if stats["processed"] % PROGRESS_EVERY < len(batch):
+                print_throughput(stats, latencies, started)
+                print_usage(client.stats())
+                if args.metrics_file:
+                    METRICS.write(args.metrics_file)
+
+    print_throughput(stats, latencies, started, out=sys.stdout)
+    api_stats = client.stats()
+    print(f"API: {api_stats['requests']} requests, {api_stats['retries']} retries, {api_stats['failures']} failures")
+    print_usage(api_stats, out=sys.stdout)
+    # Hybrid cards still make one API call each (narrowed, or inside a multi-card request).
+    if args.local_ocr == MODE_OFFLINE:
+        print(f"Local OCR: {stats['api_calls_avoided']} API calls avoided")
+    if cache:
+        cache_stats = cache.stats()
+        print(f"Extraction cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    if args.metrics_file:
+        METRICS.write(args.metrics_file)
+    return 1 if stats["failed"] else 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Extract business cards from a directory, glob or ZIP into the master store.")
+    parser.add_argument("sources", nargs="*", help="Directories, glob patterns or ZIP files of card images")
+    parser.add_argument("--store", default=str(DOCUMENTS_PATH / "business_cards_master.db"))
+    parser.add_argument("--cache", default=str(DOCUMENTS_PATH / "extraction_cache.db"))
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--checkpoint",
+                        help="File of completed image hashes; cards listed here are skipped on resume "
+                             "(default: <store>[.<namespace>].checkpoint.txt next to --store)")
+    parser.add_argument("--namespace", default=DEFAULT_NAMESPACE,
+                        help="Team namespace inside the master store; each namespace is deduplicated and exported separately")
+    parser.add_argument("--merge-threshold", type=float, default=DEFAULT_MERGE_THRESHOLD,
+                        help="Similarity score at or above which a card is merged into an existing contact")
+    parser.add_argument("--rededupe", action="store_true",
+                        help="Re-run duplicate detection over the whole master store after any ingestion")
+    parser.add_argument("--export", help="Stream the master store to this .xlsx, .csv or .jsonl file when done")
+    parser.add_argument("--local-ocr", choices=LOCAL_OCR_MODES, default=MODE_OFF,
+                        help="hybrid: read email/phone/website locally and take the rest from the API; offline: never call the API")
+    parser.add_argument("--local-min-confidence", type=float, default=DEFAULT_MIN_CONFIDENCE)
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--requests-per-second", type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                        help="Upper bound; the scheduler lowers it on 429s and slow responses and recovers gradually")
+    parser.add_argument("--latency-target", type=float, default=DEFAULT_LATENCY_TARGET,
+                        help="Responses slower than this many seconds count as overload")
+    parser.add_argument("--input-price", type=float, default=DEFAULT_INPUT_PRICE_PER_MILLION,
+                        help="USD per million prompt tokens, for the spend estimate")
+    parser.add_argument("--output-price", type=float, default=DEFAULT_OUTPUT_PRICE_PER_MILLION,
+                        help="USD per million output tokens, for the spend estimate")
+    parser.add_argument("--metrics-file", help="Write per-stage timings and counters here in Prometheus text format")
+    parser.add_argument("--metrics-port", type=int, default=0, help="Serve /metrics on this local port while running")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--base-url", default=DEFAULT_BASE_URL)
+    parser.add_argument("--max-dimension", type=int, default=DEFAULT_MAX_DIMENSION)
+    parser.add_argument("--quality", type=int, default=DEFAULT_QUALITY)
+    parser.add_argument("--image-format", default=DEFAULT_FORMAT)
+    return parser
+
+
+def main(argv=None):
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not (args.sources or args.rededupe or args.export):
+        parser.error("give at least one source, --rededupe or --export")
+    status = run(args) if args.sources else 0
+    if args.rededupe:
+        status = rededupe(args) or status
+    if args.export:
+        status = export(args) or status
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
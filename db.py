@@ -0,0 +1,50 @@
+import sqlite3
+from contextlib import contextmanager
+
+# How long a writer waits for another process's transaction before giving up with "database is locked".
+BUSY_TIMEOUT_SECONDS = 30.0
+
+
+def connect(path, timeout=BUSY_TIMEOUT_SECONDS):
+    """Open a SQLite connection that other threads and processes can share.
+
+    WAL lets readers (exports, status polls) run alongside a writer, and the busy timeout makes
+    concurrent writers queue up instead of failing.
+    """
+    conn = sqlite3.connect(str(path), timeout=timeout, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+@contextmanager
+def write_transaction(conn, lock):
+    """Run the block under lock in a BEGIN IMMEDIATE transaction.
+
+    The write lock is taken up front, so a check-then-insert inside the block is atomic across
+    processes rather than failing with a busy error when a read transaction tries to upgrade.
+    """
+    with lock:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def add_missing_column(conn, table, column, definition):
+    """Add a column to a table created by an older release. Returns True if it was added."""
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column in columns:
+        return False
+    try:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    except sqlite3.OperationalError as e:
+        # Another process upgraded the table between the check and the ALTER.
+        if "duplicate column" not in str(e):
+            raise
+        return False
+    conn.commit()
+    return True
@@ -0,0 +1,170 @@
+import re
+from difflib import SequenceMatcher
+from urllib.parse import urlparse
+
+DEFAULT_COUNTRY_CODE = "1"
+DEFAULT_MERGE_THRESHOLD = 0.85
+NAME_WEIGHT = 0.45
+CONTACT_WEIGHT = 0.45
+COMPANY_WEIGHT = 0.10
+# A shared email identifies a person; a shared phone may be a company switchboard, so it counts for less.
+EMAIL_MATCH_SCORE = 1.0
+PHONE_MATCH_SCORE = 0.7
+# Without a shared email or phone, the companies must agree at least this well for two records to merge.
+COMPANY_MATCH_SCORE = 0.8
+# Country codes whose national numbers start with trunk prefix 0, which is dropped after the country code.
+TRUNK_PREFIX_ZERO_CODES = {
+    "20", "27", "30", "31", "32", "33", "34", "41", "43", "44", "46", "49", "60", "61", "62", "63", "64", "66",
+    "81", "82", "84", "86", "90", "91", "92", "94", "212", "234", "254", "353", "358", "880", "886", "971", "972",
+}
+
+MULTI_VALUE_SEPARATORS = re.compile(r"[,;/|\n]+")
+HONORIFICS = {"mr", "mrs", "ms", "miss", "dr", "prof", "sir", "jr", "sr"}
+COMPANY_SUFFIXES = {"inc", "llc", "ltd", "limited", "corp", "corporation", "co", "gmbh", "pvt", "plc", "company"}
+
+
+def split_values(value):
+    return [part.strip() for part in MULTI_VALUE_SEPARATORS.split(value or "") if part.strip()]
+
+
+def canonical_phone(value, default_country_code=DEFAULT_COUNTRY_CODE):
+    value = re.sub(r"(?i)\s*(ext\.?|x)\s*\d+$", "", value.strip())
+    digits = re.sub(r"\D", "", value)
+    if not digits:
+        return ""
+    if value.startswith("+"):
+        return "+" + digits
+    if digits.startswith("00"):
+        return "+" + digits[2:]
+    if len(digits) == 10 and default_country_code:
+        return "+" + default_country_code + digits
+    if len(digits) == 11 and digits.startswith(default_country_code):
+        return "+" + digits
+    if digits.startswith("0"):
+        # Elsewhere (the US included) a leading 0 is not a trunk prefix; keep the national form
+        # rather than invent an international number.
+        if default_country_code in TRUNK_PREFIX_ZERO_CODES:
+            return "+" + default_country_code + digits[1:]
+        return digits
+    return "+" + digits if len(digits) > 10 else digits
+
+
+def canonical_phones(value, default_country_code=DEFAULT_COUNTRY_CODE):
+    phones = (canonical_phone(part, default_country_code) for part in split_values(value))
+    return {phone for phone in phones if len(phone.lstrip("+")) >= 7}
+
+
+def canonical_emails(value):
+    emails = set()
+    for part in re.split(r"[\s,;/|]+", value or ""):
+        part = part.strip().lower()
+        if part.startswith("mailto:"):
+            part = part[len("mailto:"):]
+        if "@" in part:
+            emails.add(part.strip("<>()[].,"))
+    return emails
+
+
+def canonical_url(value):
+    value = (value or "").strip().lower()
+    if not value:
+        return ""
+    parsed = urlparse(value if "://" in value else "http://" + value)
+    host = parsed.netloc.split("@")[-1].split(":")[0]
+    if host.startswith("www."):
+        host = host[len("www."):]
+    return host + parsed.path.rstrip("/")
+
+
+def canonical_name(value):
+    tokens = re.sub(r"[^\w\s]", " ", (value or "").lower()).split()
+    return " ".join(token for token in tokens if token not in HONORIFICS)
+
+
+def canonical_company(value):
+    tokens = re.sub(r"[^\w\s]", " ", (value or "").lower()).split()
+    return " ".join(token for token in tokens if token not in COMPANY_SUFFIXES)
+
+
+def canonical_record(row, default_country_code=DEFAULT_COUNTRY_CODE):
+    """Canonical comparison form of a row laid out like master_store.MASTER_HEADERS."""
+    return {
+        "name": canonical_name(row[2]),
+        "company": canonical_company(row[1]),
+        "phones": canonical_phones(row[4], default_country_code),
+        "emails": canonical_emails(row[5]),
+        "website": canonical_url(row[6]),
+    }
+
+
+def blocking_keys(record):
+    keys = {"e:" + email for email in record["emails"]}
+    keys.update("p:" + phone for phone in record["phones"])
+    tokens = record["name"].split()
+    if tokens:
+        keys.add(f"n:{tokens[-1]}:{tokens[0][0]}")
+    elif record["company"]:
+        keys.add("c:" + record["company"])
+    # No website key: a company domain would pull every colleague into the candidate set.
+    return keys
+
+
+def text_similarity(a, b):
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def name_similarity(a, b):
+    if a == b:
+        return 1.0
+    a_tokens, b_tokens = a.split(), b.split()
+    score = text_similarity(a, b)
+    if a_tokens and b_tokens and a_tokens[-1] == b_tokens[-1]:
+        first_a, first_b = a_tokens[0], b_tokens[0]
+        # "Jon Smith" / "Jonathan Smith" and "J Smith" / "John Smith".
+        if first_a.startswith(first_b) or first_b.startswith(first_a):
+            score = max(score, 0.9)
+    return score
+
+
+def contact_similarity(a, b):
+    if a["emails"] & b["emails"]:
+        return EMAIL_MATCH_SCORE
+    if a["phones"] & b["phones"]:
+        return PHONE_MATCH_SCORE
+    return 0.0
+
+
+def company_similarity(a, b):
+    # The website belongs to the company, not the person, so it only strengthens the company signal.
+    scores = []
+    if a["company"] and b["company"]:
+        scores.append(text_similarity(a["company"], b["company"]))
+    if a["website"] and b["website"]:
+        scores.append(1.0 if a["website"] == b["website"] else 0.0)
+    return max(scores) if scores else None
+
+
+def match_score(a, b):
+    """Weighted similarity in [0, 1] over the signals both records have.
+
+    Two records that both carry emails but share none are different people, whatever else matches.
+    A matching name alone is not enough either: without a shared email or phone, the companies
+    must match too.
+    """
+    if a["emails"] and b["emails"] and not a["emails"] & b["emails"]:
+        return 0.0
+    contact = contact_similarity(a, b)
+    company = company_similarity(a, b)
+    if not contact and (company is None or company < COMPANY_MATCH_SCORE):
+        return 0.0
+    components = []
+    if a["name"] and b["name"]:
+        components.append((name_similarity(a["name"], b["name"]), NAME_WEIGHT))
+    if (a["emails"] and b["emails"]) or (a["phones"] and b["phones"]):
+        components.append((contact, CONTACT_WEIGHT))
+    if company is not None:
+        components.append((company, COMPANY_WEIGHT))
+    total_weight = sum(weight for _, weight in components)
+    if not total_weight:
+        return 0.0
+    return sum(score * weight for score, weight in components) / total_weight
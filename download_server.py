@@ -0,0 +1,95 @@
+import mimetypes
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote, urlparse
+
+# The server stops itself after this long, so a forgotten download never keeps a port open.
+DEFAULT_LINGER_SECONDS = 300.0
+
+
+class FileDownloadServer:
+    """Serve a single file over HTTP from a daemon thread on an ephemeral localhost port.
+
+    Only that file is reachable (no directory listing, no path traversal), the body is streamed
+    with socket.sendfile (zero-copy where the OS supports it), and the working directory is never
+    changed.
+    """
+
+    def __init__(self, file_path, host="127.0.0.1", port=0, linger_seconds=DEFAULT_LINGER_SECONDS):
+        self.file_path = os.path.abspath(file_path)
+        self.file_name = os.path.basename(self.file_path)
+        self.host = host
+        self.port = port
+        self.linger_seconds = linger_seconds
+        self._server = None
+        self._thread = None
+        self._timer = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/{quote(self.file_name)}"
+
+    def _make_handler(self):
+        file_path, file_name = self.file_path, self.file_name
+        content_type = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+
+        class SingleFileHandler(BaseHTTPRequestHandler):
+            def _send_headers(self):
+                if unquote(urlparse(self.path).path).lstrip("/") not in ("", file_name):
+                    self.send_error(404)
+                    return None
+                try:
+                    f = open(file_path, "rb")
+                except OSError:
+                    self.send_error(404)
+                    return None
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+                self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(file_name)}")
+                self.end_headers()
+                return f
+
+            def do_HEAD(self):
+                f = self._send_headers()
+                if f:
+                    f.close()
+
+            def do_GET(self):
+                f = self._send_headers()
+                if f:
+                    with f:
+                        self.wfile.flush()
+                        self.connection.sendfile(f)
+
+            def log_message(self, format, *args):
+                pass
+
+        return SingleFileHandler
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_port
+        self._thread = threading.Thread(target=self._server.serve_forever, name="cardsnap-download", daemon=True)
+        self._thread.start()
+        if self.linger_seconds:
+            self._timer = threading.Timer(self.linger_seconds, self.shutdown)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def shutdown(self):
+        if self._timer is not None and self._timer is not threading.current_thread():
+            self._timer.cancel()
+        server, self._server = self._server, None
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
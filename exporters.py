@@ -0,0 +1,98 @@
+import csv
+import json
+import os
+import stat
+import tempfile
+from contextlib import contextmanager
+
+from master_store import MASTER_HEADERS
+
+MIME_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+
+
+# os.umask can only be read by setting it, so it is read once at import rather than per write.
+UMASK = os.umask(0o022)
+os.umask(UMASK)
+
+
+def output_mode(path):
+    """Permissions for a file replacing path: the existing file's, else what open() would have given it."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~UMASK
+
+
+@contextmanager
+def atomic_output(path, suffix, prefix=".cardsnap-export-"):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=prefix, suffix=suffix)
+    os.close(fd)
+    try:
+        yield temp_path
+        # mkstemp creates the file 0600; without this, saving would make the output private.
+        os.chmod(temp_path, output_mode(path))
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def export_xlsx(rows, path, headers=MASTER_HEADERS):
+    # Write-only mode streams rows to disk instead of keeping every cell object in memory.
+    # openpyxl takes longer to import than the rest of the app; only xlsx exports pay for it.
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Business Cards")
+    for col in range(1, len(headers) + 1):
+        ws.column_dimensions[get_column_letter(col)].width = 20
+
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = Font(bold=True)
+        header_cells.append(cell)
+    ws.append(header_cells)
+    for row in rows:
+        ws.append(list(row))
+
+    with atomic_output(path, ".xlsx") as temp_path:
+        wb.save(temp_path)
+    return str(path)
+
+
+def export_csv(rows, path, headers=MASTER_HEADERS):
+    with atomic_output(path, ".csv") as temp_path:
+        with open(temp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(headers)
+            writer.writerows(rows)
+    return str(path)
+
+
+def export_jsonl(rows, path, headers=MASTER_HEADERS):
+    with atomic_output(path, ".jsonl") as temp_path:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(dict(zip(headers, row)), ensure_ascii=False) + "\n")
+    return str(path)
+
+
+EXPORTERS = {"xlsx": export_xlsx, "csv": export_csv, "jsonl": export_jsonl}
+
+
+def export_master(store, path, export_format=None):
+    """Stream the master store to path; the format defaults to the file extension."""
+    export_format = (export_format or os.path.splitext(str(path))[1].lstrip(".")).lower()
+    if export_format not in EXPORTERS:
+        raise ValueError(f"Unsupported export format: {export_format!r}")
+    return EXPORTERS[export_format](store.iter_rows(), path)
@@ -0,0 +1,118 @@
+import hashlib
+import os
+
+import metrics
+from extraction_cache import cache_key
+from gemini_client import PROMPT_TEXT, ApiError, MalformedResponseError
+from image_prep import DEFAULT_FORMAT, DEFAULT_MAX_DIMENSION, DEFAULT_QUALITY, preprocess_image
+from local_ocr import DEFAULT_MIN_CONFIDENCE, MODE_OFF, MODE_OFFLINE, PATTERN_FIELDS, extract_local
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# Multi-card request failures worth retrying one card at a time: the body was too large.
+SPLIT_STATUS_CODES = {400, 413}
+
+
+def get_file_hash(file_content):
+    return hashlib.md5(file_content).hexdigest()
+
+
+def iter_zip_cards(zip_ref, on_error=None):
+    """Yield (file_content, file_name) for each image in the archive.
+
+    With on_error, a member that cannot be read (bad CRC, unsupported compression, encryption) is
+    reported as on_error(file_name, error) and skipped instead of ending the iteration.
+    """
+    # Members are decompressed one at a time as the pipeline asks for them.
+    for member in zip_ref.infolist():
+        if not member.is_dir() and member.filename.lower().endswith(IMAGE_EXTENSIONS):
+            file_name = os.path.basename(member.filename)
+            try:
+                with zip_ref.open(member) as image_file:
+                    file_content = image_file.read()
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(file_name, e)
+                continue
+            yield file_content, file_name
+
+
+def extract_batch(batch, client, cache=None, max_dimension=DEFAULT_MAX_DIMENSION, quality=DEFAULT_QUALITY,
+                  image_format=DEFAULT_FORMAT, local_mode=MODE_OFF, local_min_confidence=DEFAULT_MIN_CONFIDENCE):
+    """Extract a batch of (file_hash, file_content, file_name) cards.
+
+    Returns one (info, stats, error) tuple per card, in batch order. stats["source"] is "cache",
+    "local" (no API call) or "api"; API cards also carry the preprocessing byte counts.
+    """
+    offline = local_mode == MODE_OFFLINE
+    results = [None] * len(batch)
+    pending = []
+    for index, (file_hash, file_content, file_name) in enumerate(batch):
+        key = None if offline else cache_key(file_hash, PROMPT_TEXT, client.model)
+        info = cache.get(key) if cache and key else None
+        if info is not None:
+            results[index] = (info, {"source": "cache"}, None)
+            continue
+
+        local_info, unresolved = None, None
+        if local_mode != MODE_OFF:
+            try:
+                # Offline keeps every heuristic guess; hybrid keeps only pattern-matched fields and
+                # asks the API for the rest.
+                local_info, unresolved, resolved = extract_local(
+                    file_content, local_min_confidence, None if offline else PATTERN_FIELDS)
+            except Exception as e:
+                if offline:
+                    results[index] = (None, {"source": "local"}, e)
+                    continue
+            else:
+                if resolved or offline:
+                    results[index] = (local_info, {"source": "local"}, None)
+                    metrics.inc("local_ocr_resolved")
+                    continue
+
+        try:
+            with metrics.span("preprocess"):
+                image_data, mime_type, stats = preprocess_image(file_content, max_dimension, quality, image_format)
+        except Exception as e:
+            # An undecodable image fails only its own card, not the batch it was grouped into.
+            results[index] = (None, {"source": "api"}, e)
+            continue
+        stats["source"] = "api"
+        pending.append((index, key, image_data, mime_type, stats, local_info, unresolved))
+
+    # Partly read cards join the multi-card request too, so hybrid mode never makes more requests
+    # than off; their local fields are laid over the reply. Alone, a partly read card asks the API
+    # for just its unresolved fields.
+    infos, batch_errors = {}, {}
+    if len(pending) > 1:
+        try:
+            batch_infos = client.extract_info_from_images([(image_data, mime_type) for _, _, image_data, mime_type, _, _, _ in pending])
+            infos = {card[0]: {**info, **(card[5] or {})} for card, info in zip(pending, batch_infos)}
+        except (MalformedResponseError, ApiError) as e:
+            # A malformed reply or a body the API rejected as too large: retry one card per request
+            # below. Throttling (429/5xx after retries) fails the cards instead, since K separate
+            # requests would only multiply traffic while the API is refusing it.
+            if isinstance(e, ApiError) and e.status_code not in SPLIT_STATUS_CODES:
+                batch_errors = {card[0]: e for card in pending}
+        except Exception as e:
+            batch_errors = {card[0]: e for card in pending}
+
+    for index, key, image_data, mime_type, stats, local_info, unresolved in pending:
+        if index in batch_errors:
+            results[index] = (None, stats, batch_errors[index])
+            continue
+        try:
+            if index in infos:
+                info = infos[index]
+            elif local_info:
+                info = {**client.extract_fields(image_data, mime_type, unresolved), **local_info}
+            else:
+                info = client.extract_info_from_image(image_data, mime_type)
+        except Exception as e:
+            results[index] = (None, stats, e)
+            continue
+        if info and cache:
+            cache.put(key, info)
+        results[index] = (info, stats, None)
+    return results
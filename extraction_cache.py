@@ -0,0 +1,97 @@
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+
+import metrics
+from db import connect
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS extractions (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_extractions_last_used ON extractions (last_used);
+"""
+
+
+def cache_key(image_digest, prompt, model):
+    prompt_digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{image_digest}:{model}:{prompt_digest}".encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """Persistent LRU cache of parsed extraction results, bounded by total stored bytes."""
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = connect(self.path)
+        self._conn.executescript(SCHEMA)
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+
+    def get(self, key):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value FROM extractions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                metrics.inc("cache_misses")
+                return None
+            self._conn.execute("UPDATE extractions SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            metrics.inc("cache_hits")
+            return json.loads(row[0])
+
+    def put(self, key, value):
+        payload = json.dumps(value)
+        size = len(payload.encode("utf-8"))
+        with self._lock, self._conn:
+            old = self._conn.execute("SELECT size FROM extractions WHERE key = ?", (key,)).fetchone()
+            if old:
+                self._total_bytes -= old[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extractions (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, payload, size, time.time()),
+            )
+            self._total_bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes:
+            victims = self._conn.execute(
+                "SELECT key, size FROM extractions ORDER BY last_used LIMIT 64"
+            ).fetchall()
+            if not victims:
+                self._total_bytes = 0
+                return
+            for key, size in victims:
+                if self._total_bytes <= self.max_bytes:
+                    return
+                self._conn.execute("DELETE FROM extractions WHERE key = ?", (key,))
+                self._total_bytes -= size
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": self._total_bytes,
+            }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,163 @@
+import re
+from functools import lru_cache
+
+STANDARD_FIELDS = ["Company Name", "Person Name", "Designation", "Phone", "Email", "Website", "Address"]
+
+FIELD_MAPPING = {
+    "company name": "Company Name",
+    "company's name": "Company Name",
+    "company": "Company Name",
+    "person's name": "Person Name",
+    "person name": "Person Name",
+    "name": "Person Name",
+    "person": "Person Name",
+    "full name": "Person Name",
+    "designation": "Designation",
+    "title": "Designation",
+    "job title": "Designation",
+    "position": "Designation",
+    "role": "Designation",
+    "phone": "Phone",
+    "phone number": "Phone",
+    "mobile": "Phone",
+    "telephone": "Phone",
+    "tel": "Phone",
+    "contact": "Phone",
+    "email": "Email",
+    "mail": "Email",
+    "e-mail": "Email",
+    "email address": "Email",
+    "website": "Website",
+    "web": "Website",
+    "url": "Website",
+    "site": "Website",
+    "web address": "Website",
+    "address": "Address",
+    "location": "Address",
+    "office": "Address",
+    "office address": "Address",
+}
+
+# Raw keys seen from the API and the field each must resolve to. Run this module to check them.
+FIELD_KEY_VARIANTS = {
+    "Company Name": "Company Name",
+    "company": "Company Name",
+    "Company's Name": "Company Name",
+    "company_name": "Company Name",
+    "Name of Company": "Company Name",
+    "Person Name": "Person Name",
+    "Person's Name": "Person Name",
+    "full name": "Person Name",
+    "Name": "Person Name",
+    "contact name": "Person Name",
+    "Designation": "Designation",
+    "Job Title": "Designation",
+    "job-title": "Designation",
+    "Position": "Designation",
+    "Role": "Designation",
+    "Phone": "Phone",
+    "Phone Number": "Phone",
+    "phone_number": "Phone",
+    "Mobile": "Phone",
+    "mobile number": "Phone",
+    "Tel.": "Phone",
+    "Telephone": "Phone",
+    "contact": "Phone",
+    "office phone": "Phone",
+    "Contact Number": "Phone",
+    "Email": "Email",
+    "E-mail": "Email",
+    "e_mail": "Email",
+    "Email Address": "Email",
+    "contact email": "Email",
+    "emailaddress": "Email",
+    "Mail": "Email",
+    "Website": "Website",
+    "Web": "Website",
+    "URL": "Website",
+    "company website": "Website",
+    "Web Address": "Website",
+    "site": "Website",
+    "Address": "Address",
+    "Office Address": "Address",
+    "office": "Address",
+    "Location": "Address",
+    "mailing address": "Address",
+}
+
+
+def normalize_key(raw_key):
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", raw_key.lower().replace("'", "")).split())
+
+
+def build_token_trie(mapping):
+    trie = {}
+    for key, std_field in mapping.items():
+        node = trie
+        for token in key.split():
+            node = node.setdefault(token, {})
+        node[None] = std_field
+    return trie
+
+
+NORMALIZED_MAPPING = {normalize_key(key): std_field for key, std_field in FIELD_MAPPING.items()}
+TOKEN_TRIE = build_token_trie(NORMALIZED_MAPPING)
+SUBSTRING_KEYS = sorted((key.replace(" ", "") for key in NORMALIZED_MAPPING), key=len, reverse=True)
+COMPACT_MAPPING = {key.replace(" ", ""): std_field for key, std_field in NORMALIZED_MAPPING.items()}
+
+
+def longest_token_match(tokens):
+    # Longest run of tokens wins; among equally long runs the rightmost one does,
+    # since the head noun comes last ("contact email" is an email, not a phone).
+    best = None
+    for start in range(len(tokens)):
+        node = TOKEN_TRIE
+        for end in range(start, len(tokens)):
+            node = node.get(tokens[end])
+            if node is None:
+                break
+            if None in node:
+                length = end - start + 1
+                if best is None or length >= best[0]:
+                    best = (length, node[None])
+    return best[1] if best else None
+
+
+def longest_substring_match(compact_key):
+    best = None
+    for key in SUBSTRING_KEYS:
+        if best and len(key) < len(best[0]):
+            break
+        position = compact_key.rfind(key)
+        if position >= 0 and (best is None or position > best[1]):
+            best = (key, position)
+    return COMPACT_MAPPING[best[0]] if best else None
+
+
+@lru_cache(maxsize=4096)
+def resolve_field(raw_key):
+    """Map a raw key from the API to a standard field name, or None if nothing matches."""
+    normalized_key = normalize_key(raw_key)
+    std_field = NORMALIZED_MAPPING.get(normalized_key)
+    if std_field:
+        return std_field
+    std_field = longest_token_match(normalized_key.split())
+    if std_field:
+        return std_field
+    return longest_substring_match(normalized_key.replace(" ", ""))
+
+
+def normalize_fields(info_dict):
+    normalized_data = {}
+    for field, value in info_dict.items():
+        normalized_data[resolve_field(field) or field] = value
+    return normalized_data
+
+
+if __name__ == "__main__":
+    mismatches = {raw: (resolve_field(raw), expected) for raw, expected in FIELD_KEY_VARIANTS.items()
+                  if resolve_field(raw) != expected}
+    for raw, (got, expected) in mismatches.items():
+        print(f"{raw!r}: got {got!r}, expected {expected!r}")
+    print(f"{len(FIELD_KEY_VARIANTS) - len(mismatches)}/{len(FIELD_KEY_VARIANTS)} key variants resolved correctly")
+    raise SystemExit(1 if mismatches else 0)
@@ -0,0 +1,207 @@
+import base64
+import email.utils
+import json
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from response_parser import MalformedResponseError, card_list_schema, card_schema, find_json_value, validate_card, validate_cards
+from scheduler import UsageTracker, usage_from_response
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+DEFAULT_MODEL = "gemini-1.5-flash"
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 60.0
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 30.0
+DEFAULT_POOL_SIZE = 16
+DEFAULT_PARSE_RETRIES = 1
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+LATENCY_WINDOW = 1000
+
+PROMPT_TEXT = "Extract the Company Name, Person's Name, Designation, Phone, Email, Website, and Address from this business card. Respond only with JSON format. Use exactly these field names: 'Company Name', 'Person Name', 'Designation', 'Phone', 'Email', 'Website', 'Address'. Do NOT use triple backticks or markdown."
+BATCH_PROMPT_TEXT = "These are {count} business card images. For each image, in the order given, extract the Company Name, Person's Name, Designation, Phone, Email, Website, and Address. Respond only with a JSON array of exactly {count} objects, one per image in the same order. Use exactly these field names: 'Company Name', 'Person Name', 'Designation', 'Phone', 'Email', 'Website', 'Address'. Do NOT use triple backticks or markdown."
+
+FIELDS_PROMPT_TEXT = "Extract the {fields} from this business card. Respond only with JSON format. Use exactly these field names: {names}. Do NOT use triple backticks or markdown."
+
+
+class ApiError(RuntimeError):
+    def __init__(self, status_code, text):
+        super().__init__(f"API Error: {status_code} - {text}")
+        self.status_code = status_code
+
+
+def encode_image(image_bytes):
+    return base64.b64encode(image_bytes)
+
+
+def build_request_body(prompt_text, images, response_schema=None):
+    # Base64 is JSON-safe, so each encoded image is spliced into the body
+    # without an intermediate str or a json.dumps copy of the payload.
+    parts = [{"text": prompt_text}] + [{"inlineData": {"mimeType": mime_type, "data": ""}} for _, mime_type in images]
+    request = {"contents": [{"parts": parts}]}
+    if response_schema:
+        request["generationConfig"] = {"responseMimeType": "application/json", "responseSchema": response_schema}
+    chunks = json.dumps(request).split('"data": ""')
+    body = [chunks[0].encode("utf-8")]
+    for (image_bytes, _), chunk in zip(images, chunks[1:]):
+        body += [b'"data": "', encode_image(image_bytes), b'"', chunk.encode("utf-8")]
+    return b"".join(body)
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class GeminiClient:
+    def __init__(self, api_key, model=DEFAULT_MODEL, base_url=DEFAULT_BASE_URL,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff_base=DEFAULT_BACKOFF_BASE,
+                 backoff_max=DEFAULT_BACKOFF_MAX, pool_size=DEFAULT_POOL_SIZE, rate_limiter=None,
+                 structured_output=True, parse_retries=DEFAULT_PARSE_RETRIES, usage=None):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = rate_limiter
+        self.structured_output = structured_output
+        self.parse_retries = parse_retries
+        self.usage = usage or UsageTracker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Content-Type": "application/json", "x-goog-api-key": api_key or ""})
+
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._counters = {"requests": 0, "retries": 0, "failures": 0, "parse_retries": 0}
+
+    @property
+    def url(self):
+        return f"{self.base_url}/models/{self.model}:generateContent"
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._counters[name] += 1
+        metrics.inc(f"api_{name}")
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post(self, body):
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            self._count("requests")
+            metrics.inc("bytes_uploaded", len(body))
+            started = time.monotonic()
+            try:
+                response = self.session.post(self.url, data=body, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if self.rate_limiter:
+                    self.rate_limiter.release()
+                if attempt >= self.max_retries:
+                    self._count("failures")
+                    raise
+                delay = self._backoff(attempt)
+            except BaseException:
+                if self.rate_limiter:
+                    self.rate_limiter.release()
+                raise
+            else:
+                latency = time.monotonic() - started
+                if self.rate_limiter:
+                    self.rate_limiter.release(response.status_code, latency)
+                metrics.observe("api_request", latency)
+                with self._stats_lock:
+                    self._latencies.append(latency)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    if response.status_code != 200:
+                        self._count("failures")
+                    return response
+                delay = self._backoff(attempt, parse_retry_after(response.headers.get("Retry-After")))
+            self._count("retries")
+            attempt += 1
+            time.sleep(delay)
+
+    def generate_content(self, prompt_text, images, response_schema=None, validate=validate_card):
+        with metrics.span("encode"):
+            body = build_request_body(prompt_text, images, response_schema if self.structured_output else None)
+        attempt = 0
+        while True:
+            response = self.post(body)
+            if response.status_code != 200:
+                raise ApiError(response.status_code, response.text)
+            try:
+                with metrics.span("parse"):
+                    data = response.json()
+                    extracted_text = data['candidates'][0]['content']['parts'][0]['text']
+                    self._record_usage(usage_from_response(data, prompt_text, len(images), extracted_text))
+                    return validate(find_json_value(extracted_text))
+            except (ValueError, KeyError, IndexError, TypeError, MalformedResponseError) as e:
+                if attempt >= self.parse_retries:
+                    raise MalformedResponseError(f"Error processing image: {e}")
+            self._count("parse_retries")
+            attempt += 1
+
+    def _record_usage(self, usage):
+        usage = self.usage.record(**usage)
+        for name in ("input_tokens", "output_tokens", "image_tokens"):
+            metrics.inc(name, usage[name])
+
+    def extract_info_from_image(self, image_bytes, mime_type="image/jpeg"):
+        return self.generate_content(PROMPT_TEXT, [(image_bytes, mime_type)], card_schema())
+
+    def extract_fields(self, image_bytes, mime_type, fields):
+        prompt_text = FIELDS_PROMPT_TEXT.format(fields=", ".join(fields), names=", ".join(f"'{field}'" for field in fields))
+        return self.generate_content(prompt_text, [(image_bytes, mime_type)], card_schema(fields))
+
+    def extract_info_from_images(self, images):
+        return self.generate_content(
+            BATCH_PROMPT_TEXT.format(count=len(images)), images, card_list_schema(),
+            validate=lambda value: validate_cards(value, len(images)),
+        )
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = list(self._latencies)
+            stats = dict(self._counters)
+        stats["latency_p50"] = percentile(latencies, 0.50)
+        stats["latency_p95"] = percentile(latencies, 0.95)
+        stats["usage"] = self.usage.totals()
+        if hasattr(self.rate_limiter, "stats"):
+            stats["scheduler"] = self.rate_limiter.stats()
+        return stats
+
+    def close(self):
+        self.session.close()
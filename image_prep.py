@@ -0,0 +1,72 @@
+import io
+
+DEFAULT_MAX_DIMENSION = 1600
+DEFAULT_QUALITY = 85
+DEFAULT_FORMAT = "JPEG"
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+# A detected card must cover at least this share of the photo before we crop to it,
+# otherwise a busy background is more likely than a card edge.
+MIN_CARD_AREA_RATIO = 0.2
+CROP_THRESHOLD = 40
+CROP_MARGIN = 0.02
+
+
+def crop_to_card(img):
+    from PIL import Image, ImageChops
+
+    gray = img.convert("L")
+    width, height = gray.size
+    corners = [gray.getpixel(point) for point in ((0, 0), (width - 1, 0), (0, height - 1), (width - 1, height - 1))]
+    background = sorted(corners)[len(corners) // 2]
+    diff = ImageChops.difference(gray, Image.new("L", gray.size, background))
+    bbox = diff.point(lambda value: 255 if value > CROP_THRESHOLD else 0).getbbox()
+    if not bbox:
+        return img
+
+    left, top, right, bottom = bbox
+    if (right - left) * (bottom - top) < MIN_CARD_AREA_RATIO * width * height:
+        return img
+    margin_x, margin_y = int(width * CROP_MARGIN), int(height * CROP_MARGIN)
+    return img.crop((max(0, left - margin_x), max(0, top - margin_y),
+                     min(width, right + margin_x), min(height, bottom + margin_y)))
+
+
+def flatten(img):
+    if img.mode in ("RGBA", "LA", "P"):
+        from PIL import Image
+
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    return img.convert("RGB") if img.mode != "RGB" else img
+
+
+def preprocess_image(image_bytes, max_dimension=DEFAULT_MAX_DIMENSION, quality=DEFAULT_QUALITY,
+                     image_format=DEFAULT_FORMAT):
+    """Auto-orient, crop, downscale and re-encode a card photo for upload.
+
+    Returns (data, mime_type, stats). The original bytes are kept when re-encoding does not make them smaller.
+    """
+    # PIL is only loaded once a card is actually processed.
+    from PIL import Image, ImageOps
+
+    image_format = image_format.upper()
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        original_format = img.format
+        img = ImageOps.exif_transpose(img)
+        img = crop_to_card(img)
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        output = io.BytesIO()
+        flatten(img).save(output, format=image_format, quality=quality, optimize=True)
+
+    data, mime_type = output.getvalue(), MIME_TYPES.get(image_format, "image/jpeg")
+    if len(data) >= len(image_bytes):
+        data, mime_type = image_bytes, MIME_TYPES.get(original_format, "image/jpeg")
+    stats = {
+        "original_bytes": len(image_bytes),
+        "uploaded_bytes": len(data),
+        "bytes_saved": len(image_bytes) - len(data),
+    }
+    return data, mime_type, stats
@@ -0,0 +1,397 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from db import add_missing_column, connect, write_transaction
+from extraction import get_file_hash
+from pipeline import DEFAULT_MAX_WORKERS, imap_ordered
+from scheduler import BULK, priority
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Outcomes recorded for a done item.
+ADDED = "added"
+DUPLICATE = "duplicate"
+EMPTY = "empty"
+
+DEFAULT_POLL_INTERVAL = 1.0
+# After a failed round (e.g. the database stayed locked past its busy timeout) the worker waits
+# poll_interval, doubling per consecutive failure up to this.
+MAX_ERROR_BACKOFF = 60.0
+# A claimed item belongs to its worker until the lease runs out; live workers renew their leases
+# every LEASE_RENEW_FRACTION of it, so only items of dead workers ever expire.
+DEFAULT_LEASE_SECONDS = 120.0
+LEASE_RENEW_FRACTION = 0.25
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    namespace TEXT NOT NULL DEFAULT '',
+    priority INTEGER NOT NULL DEFAULT 1,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_items (
+    id INTEGER PRIMARY KEY,
+    job_id INTEGER NOT NULL REFERENCES jobs (id),
+    file_hash TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    spool_path TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    outcome TEXT NOT NULL DEFAULT '',
+    source TEXT NOT NULL DEFAULT '',
+    error TEXT NOT NULL DEFAULT '',
+    tokens REAL NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0,
+    uploaded_bytes INTEGER NOT NULL DEFAULT 0,
+    bytes_saved INTEGER NOT NULL DEFAULT 0,
+    owner TEXT NOT NULL DEFAULT '',
+    lease_expires REAL NOT NULL DEFAULT 0,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_job_items_status ON job_items (status, id);
+CREATE INDEX IF NOT EXISTS idx_job_items_job ON job_items (job_id);
+CREATE INDEX IF NOT EXISTS idx_job_items_hash ON job_items (file_hash);
+"""
+
+
+class JobQueue:
+    """SQLite-backed queue of card extraction jobs whose images are spooled to disk.
+
+    Each claim is leased to this queue object. Items whose lease expired (their process died or
+    restarted) are claimed again, so a job resumes after its last completed card, while items
+    held by live workers in other processes are left alone.
+    """
+
+    def __init__(self, path, spool_dir, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.spool_dir = Path(spool_dir)
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._conn = connect(self.path)
+        self._conn.executescript(SCHEMA)
+        add_missing_column(self._conn, "jobs", "namespace", "TEXT NOT NULL DEFAULT ''")
+        add_missing_column(self._conn, "jobs", "priority", f"INTEGER NOT NULL DEFAULT {BULK}")
+        add_missing_column(self._conn, "job_items", "tokens", "REAL NOT NULL DEFAULT 0")
+        add_missing_column(self._conn, "job_items", "cost", "REAL NOT NULL DEFAULT 0")
+        add_missing_column(self._conn, "job_items", "uploaded_bytes", "INTEGER NOT NULL DEFAULT 0")
+        add_missing_column(self._conn, "job_items", "bytes_saved", "INTEGER NOT NULL DEFAULT 0")
+        add_missing_column(self._conn, "job_items", "owner", "TEXT NOT NULL DEFAULT ''")
+        add_missing_column(self._conn, "job_items", "lease_expires", "REAL NOT NULL DEFAULT 0")
+        self.recovered = self.recover()
+
+    def recover(self):
+        """Put running items whose lease has expired back to pending. Returns how many there were."""
+        now = time.time()
+        with write_transaction(self._conn, self._lock):
+            return self._conn.execute(
+                "UPDATE job_items SET status = ?, owner = '', updated = ? WHERE status = ? AND lease_expires < ?",
+                (PENDING, now, RUNNING, now),
+            ).rowcount
+
+    def release(self):
+        """Put every item this queue object still holds back to pending, for a worker that lost track of them."""
+        with write_transaction(self._conn, self._lock):
+            return self._conn.execute(
+                "UPDATE job_items SET status = ?, owner = '', updated = ? WHERE status = ? AND owner = ?",
+                (PENDING, time.time(), RUNNING, self.owner),
+            ).rowcount
+
+    def renew(self):
+        """Extend the leases of every item this queue object is still working on."""
+        now = time.time()
+        with write_transaction(self._conn, self._lock):
+            return self._conn.execute(
+                "UPDATE job_items SET lease_expires = ? WHERE status = ? AND owner = ?",
+                (now + self.lease_seconds, RUNNING, self.owner),
+            ).rowcount
+
+    def create_job(self, name, namespace="", job_priority=BULK):
+        with write_transaction(self._conn, self._lock):
+            return self._conn.execute(
+                "INSERT INTO jobs (name, namespace, priority, created) VALUES (?, ?, ?, ?)",
+                (name, namespace, job_priority, time.time()),
+            ).lastrowid
+
+    def _spool(self, file_hash, file_name, file_content):
+        spool_path = self.spool_dir / f"{file_hash}{Path(file_name).suffix.lower()}"
+        if not spool_path.is_file():
+            temp_path = spool_path.with_suffix(spool_path.suffix + ".tmp")
+            temp_path.write_bytes(file_content)
+            os.replace(temp_path, spool_path)
+        return spool_path
+
+    def enqueue(self, job_id, file_content, file_name):
+        """Spool a card and queue it under job_id. Returns False if the same image is already queued or done."""
+        file_hash = get_file_hash(file_content)
+        with write_transaction(self._conn, self._lock):
+            namespace = self._conn.execute("SELECT namespace FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+            if self._conn.execute(
+                "SELECT 1 FROM job_items JOIN jobs ON jobs.id = job_items.job_id "
+                "WHERE file_hash = ? AND status != ? AND jobs.namespace = ? LIMIT 1", (file_hash, FAILED, namespace)
+            ).fetchone():
+                return False
+            # The spool file is written before its row exists, so a queued item always has its image.
+            spool_path = self._spool(file_hash, file_name, file_content)
+            self._conn.execute(
+                "INSERT INTO job_items (job_id, file_hash, file_name, spool_path, updated) VALUES (?, ?, ?, ?, ?)",
+                (job_id, file_hash, file_name, str(spool_path), time.time()),
+            )
+        return True
+
+    def claim(self, limit):
+        """Lease up to limit pending or expired items to this queue object, interactive jobs first.
+
+        Returns them as (item_id, file_hash, file_content, file_name, namespace, priority). The claim
+        is one immediate transaction and live leases are skipped, so workers in other processes
+        never take the same item.
+        """
+        now = time.time()
+        with write_transaction(self._conn, self._lock):
+            rows = self._conn.execute(
+                "SELECT job_items.id, file_hash, file_name, spool_path, jobs.namespace, jobs.priority FROM job_items "
+                "JOIN jobs ON jobs.id = job_items.job_id WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                "ORDER BY jobs.priority, job_items.id LIMIT ?",
+                (PENDING, RUNNING, now, limit),
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE job_items SET status = ?, owner = ?, lease_expires = ?, updated = ? WHERE id = ?",
+                [(RUNNING, self.owner, now + self.lease_seconds, now, row[0]) for row in rows],
+            )
+        claimed = []
+        for item_id, file_hash, file_name, spool_path, namespace, job_priority in rows:
+            try:
+                claimed.append((item_id, file_hash, Path(spool_path).read_bytes(), file_name, namespace, job_priority))
+            except OSError as e:
+                self.fail(item_id, f"Spooled image is missing: {e}")
+        return claimed
+
+    def _finish(self, item_id, status, outcome="", source="", error="", tokens=0, cost=0.0, uploaded_bytes=0,
+                bytes_saved=0):
+        with write_transaction(self._conn, self._lock):
+            row = self._conn.execute("SELECT spool_path FROM job_items WHERE id = ?", (item_id,)).fetchone()
+            # A worker whose lease lapsed and was taken over must not overwrite the new owner's result.
+            finished = self._conn.execute(
+                "UPDATE job_items SET status = ?, outcome = ?, source = ?, error = ?, tokens = ?, cost = ?, "
+                "uploaded_bytes = ?, bytes_saved = ?, updated = ? WHERE id = ? AND status = ? AND owner = ?",
+                (status, outcome, source, error, tokens, cost, uploaded_bytes, bytes_saved, time.time(), item_id,
+                 RUNNING, self.owner),
+            ).rowcount
+            # The same image queued for another namespace shares the spool file.
+            if finished and row and not self._conn.execute(
+                "SELECT 1 FROM job_items WHERE spool_path = ? AND status IN (?, ?) LIMIT 1", (row[0], PENDING, RUNNING)
+            ).fetchone():
+                Path(row[0]).unlink(missing_ok=True)
+
+    def complete(self, item_id, outcome, source="", tokens=0, cost=0.0, uploaded_bytes=0, bytes_saved=0):
+        self._finish(item_id, DONE, outcome=outcome, source=source, tokens=tokens, cost=cost,
+                     uploaded_bytes=uploaded_bytes, bytes_saved=bytes_saved)
+
+    def fail(self, item_id, error, tokens=0, cost=0.0):
+        self._finish(item_id, FAILED, error=str(error), tokens=tokens, cost=cost)
+
+    def jobs(self, limit=20, namespace=None):
+        """Most recent jobs first, each with its item counts by status and outcome."""
+        with self._lock:
+            jobs = self._conn.execute(
+                "SELECT id, name, namespace, priority, created FROM jobs WHERE ? IS NULL OR namespace = ? "
+                "ORDER BY id DESC LIMIT ?",
+                (namespace, namespace, limit),
+            ).fetchall()
+            summaries = []
+            for job_id, name, job_namespace, job_priority, created in jobs:
+                counts = dict(self._conn.execute(
+                    "SELECT CASE WHEN status = ? THEN outcome ELSE status END, COUNT(*) FROM job_items "
+                    "WHERE job_id = ? GROUP BY 1", (DONE, job_id),
+                ).fetchall())
+                local, tokens, cost, uploaded_bytes, bytes_saved = self._conn.execute(
+                    "SELECT COUNT(CASE WHEN source = 'local' THEN 1 END), COALESCE(SUM(tokens), 0), COALESCE(SUM(cost), 0), "
+                    "COALESCE(SUM(uploaded_bytes), 0), COALESCE(SUM(bytes_saved), 0) FROM job_items WHERE job_id = ?", (job_id,)
+                ).fetchone()
+                total = sum(counts.values())
+                summaries.append({
+                    "id": job_id,
+                    "name": name,
+                    "namespace": job_namespace,
+                    "priority": job_priority,
+                    "created": created,
+                    "total": total,
+                    "finished": total - counts.get(PENDING, 0) - counts.get(RUNNING, 0),
+                    "added": counts.get(ADDED, 0),
+                    "duplicates": counts.get(DUPLICATE, 0),
+                    "failed": counts.get(FAILED, 0),
+                    "api_calls_avoided": local,
+                    "tokens": int(tokens),
+                    "estimated_cost": cost,
+                    "uploaded_bytes": uploaded_bytes,
+                    "bytes_saved": bytes_saved,
+                })
+            return summaries
+
+    def uploads(self, job_id):
+        """(file_name, uploaded_bytes, bytes_saved) of each card of a job that was sent to the API."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT file_name, uploaded_bytes, bytes_saved FROM job_items WHERE job_id = ? AND uploaded_bytes > 0 "
+                "ORDER BY id", (job_id,)
+            ).fetchall()
+
+    def errors(self, job_id):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT file_name, error FROM job_items WHERE job_id = ? AND status = ? ORDER BY id", (job_id, FAILED)
+            ).fetchall()
+
+    def forget_finished(self, namespace):
+        """Drop a namespace's finished items and empty jobs, so the same images can be queued again there."""
+        with write_transaction(self._conn, self._lock):
+            removed = self._conn.execute(
+                "DELETE FROM job_items WHERE status IN (?, ?) AND job_id IN (SELECT id FROM jobs WHERE namespace = ?)",
+                (DONE, FAILED, namespace),
+            ).rowcount
+            self._conn.execute(
+                "DELETE FROM jobs WHERE namespace = ? AND id NOT IN (SELECT DISTINCT job_id FROM job_items)", (namespace,)
+            )
+            return removed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobWorker:
+    """Background thread that drains a JobQueue through extract(batch) and hands each card to on_result.
+
+    extract takes a list of (file_hash, file_content, file_name) and returns one (info, stats, error)
+    per card, like extraction.extract_batch. on_result(info, file_name, namespace) stores a card in
+    its job's namespace and returns ADDED or DUPLICATE; an exception from it fails just that card.
+    With a scheduler.UsageTracker as usage, each batch's token spend is split over its cards.
+    after_batch() is called once each batch's cards are recorded, e.g. to publish metrics.
+    """
+
+    def __init__(self, queue, extract, on_result, batch_size=1, max_workers=DEFAULT_MAX_WORKERS,
+                 poll_interval=DEFAULT_POLL_INTERVAL, usage=None, after_batch=None):
+        self.queue = queue
+        self.extract = extract
+        self.on_result = on_result
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.poll_interval = poll_interval
+        self.usage = usage
+        self.after_batch = after_batch
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._heartbeat = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="cardsnap-job-worker", daemon=True)
+            self._thread.start()
+            self._heartbeat = threading.Thread(target=self._renew_leases, args=(self._thread,),
+                                               name="cardsnap-job-heartbeat", daemon=True)
+            self._heartbeat.start()
+        return self
+
+    def _renew_leases(self, worker):
+        # Separate from _run, which blocks on API calls for longer than a lease may last; it keeps
+        # going while a stopping worker finishes the cards it already claimed.
+        while worker.is_alive():
+            worker.join(self.queue.lease_seconds * LEASE_RENEW_FRACTION)
+            try:
+                self.queue.renew()
+            except Exception:
+                # A lease outlasts several renewal intervals, so one failed renewal is survivable.
+                logger.exception("Could not renew job leases")
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._heartbeat is not None:
+            self._heartbeat.join(timeout)
+
+    def _extract(self, items):
+        cards = [(file_hash, content, file_name) for _, file_hash, content, file_name, _, _ in items]
+        # Runs on a pool thread; the priority applies to every API call the batch makes.
+        with priority(min(item[5] for item in items)):
+            if self.usage is None:
+                return self.extract(cards), None
+            with self.usage.scope() as batch_usage:
+                return self.extract(cards), batch_usage
+
+    def _claimed_batches(self):
+        # Claimed lazily as imap_ordered's window slides, so a newly queued interactive job is
+        # picked up within a few batches; the round ends once the queue is empty.
+        while not self._stopping.is_set():
+            items = self.queue.claim(self.batch_size)
+            if not items:
+                return
+            yield items
+
+    def _run(self):
+        failures, orphaned = 0, False
+        while not self._stopping.is_set():
+            try:
+                if orphaned:
+                    self.queue.release()
+                    orphaned = False
+                processed = self._run_round()
+            except Exception:
+                # One database error must not end the worker: it is the only one this process has.
+                failures += 1
+                orphaned = True
+                logger.exception("Job worker round failed; retrying")
+                self._stopping.wait(min(MAX_ERROR_BACKOFF, self.poll_interval * 2 ** failures))
+                continue
+            failures = 0
+            if not processed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _run_round(self):
+        """Drain the queue once. Returns whether any batch was processed."""
+        processed = False
+        for items, result, batch_error in imap_ordered(self._extract, self._claimed_batches(), self.max_workers):
+            processed = True
+            results, batch_usage = result or ([(None, {}, batch_error)] * len(items), None)
+            share = {"tokens": 0, "cost": 0.0}
+            if batch_usage:
+                share = {"tokens": (batch_usage["input_tokens"] + batch_usage["output_tokens"]) / len(items),
+                         "cost": batch_usage["estimated_cost"] / len(items)}
+            for (item_id, _, _, file_name, namespace, _), (info, stats, error) in zip(items, results):
+                if error:
+                    self.queue.fail(item_id, error, **share)
+                    continue
+                try:
+                    outcome = self.on_result(info, file_name, namespace) if info else EMPTY
+                except Exception as e:
+                    self.queue.fail(item_id, e, **share)
+                    continue
+                self.queue.complete(item_id, outcome, stats.get("source", ""), uploaded_bytes=stats.get("uploaded_bytes", 0),
+                                    bytes_saved=stats.get("bytes_saved", 0), **share)
+            if self.after_batch:
+                try:
+                    self.after_batch()
+                except Exception:
+                    # The batch is already recorded; a failed hook must not send it round again.
+                    logger.exception("after_batch hook failed")
+        return processed
+
@@ -0,0 +1,133 @@
+import io
+import re
+
+from fields import STANDARD_FIELDS
+
+MODE_OFF = "off"
+MODE_HYBRID = "hybrid"
+MODE_OFFLINE = "offline"
+MODES = (MODE_OFF, MODE_HYBRID, MODE_OFFLINE)
+
+DEFAULT_MIN_CONFIDENCE = 80.0
+# Fields read by pattern match. Hybrid mode trusts only these; the rest come from guessing which
+# field an unlabeled line belongs to, so the API is still asked for them.
+PATTERN_FIELDS = ("Email", "Phone", "Website")
+
+EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+PHONE_RE = re.compile(r"(?:\+?\d[\d\s().-]{6,}\d)")
+URL_RE = re.compile(
+    r"(?:https?://|www\.)\S+|\b[\w-]+(?:\.[\w-]+)*\.(?:com|net|org|io|co|in|ai|biz|info|us|uk|de|app|dev)\b(?:/\S*)?",
+    re.IGNORECASE,
+)
+DESIGNATION_WORDS = {
+    "ceo", "cto", "cfo", "coo", "founder", "co-founder", "president", "director", "manager", "engineer",
+    "consultant", "partner", "head", "lead", "officer", "executive", "associate", "analyst", "designer",
+    "developer", "specialist", "sales", "marketing", "vp", "chairman", "owner", "architect",
+}
+COMPANY_WORDS = {"inc", "inc.", "llc", "ltd", "ltd.", "limited", "corp", "corp.", "corporation", "gmbh",
+                 "pvt", "plc", "co.", "company", "group", "technologies", "solutions", "labs", "studio"}
+ADDRESS_WORDS = {"street", "st", "st.", "road", "rd", "rd.", "avenue", "ave", "ave.", "suite", "floor",
+                 "blvd", "lane", "ln", "drive", "dr.", "building", "sector", "city", "zip"}
+
+
+def load_pytesseract():
+    # Imported on first use so the OCR tier costs nothing at startup when it is off.
+    try:
+        import pytesseract
+    except ImportError:
+        return None
+    return pytesseract
+
+
+def is_available():
+    pytesseract = load_pytesseract()
+    if pytesseract is None:
+        return False
+    try:
+        pytesseract.get_tesseract_version()
+    except Exception:
+        return False
+    return True
+
+
+def ocr_lines(image_bytes):
+    """Return [(line_text, mean_word_confidence)] in reading order."""
+    pytesseract = load_pytesseract()
+    if pytesseract is None:
+        raise RuntimeError("Local OCR needs the pytesseract package and the tesseract binary.")
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img = ImageOps.exif_transpose(img).convert("L")
+        data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT)
+
+    lines = {}
+    for i, word in enumerate(data["text"]):
+        confidence = float(data["conf"][i])
+        if not word.strip() or confidence < 0:
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append((word, confidence))
+    return [(" ".join(word for word, _ in words), sum(c for _, c in words) / len(words))
+            for _, words in sorted(lines.items())]
+
+
+def parse_lines(lines):
+    """Heuristically assign OCR lines to card fields. Returns {field: (value, confidence)}."""
+    fields = {}
+
+    def found(field, value, confidence):
+        if value and (field not in fields or confidence > fields[field][1]):
+            fields[field] = (value.strip(" ,;|"), confidence)
+
+    remaining = []
+    for text, confidence in lines:
+        lowered = text.lower()
+        email = EMAIL_RE.search(text)
+        if email:
+            found("Email", email.group(0), confidence)
+            text = text.replace(email.group(0), " ")
+        phones = [match.group(0) for match in PHONE_RE.finditer(text) if sum(ch.isdigit() for ch in match.group(0)) >= 7]
+        if phones:
+            found("Phone", ", ".join(phone.strip() for phone in phones), confidence)
+            for phone in phones:
+                text = text.replace(phone, " ")
+        url = URL_RE.search(text)
+        if url and "@" not in url.group(0):
+            found("Website", url.group(0), confidence)
+            text = text.replace(url.group(0), " ")
+        if email or phones or url:
+            continue
+
+        words = set(lowered.split())
+        if words & DESIGNATION_WORDS:
+            found("Designation", text, confidence)
+        elif words & COMPANY_WORDS:
+            found("Company Name", text, confidence)
+        elif any(ch.isdigit() for ch in text) and (words & ADDRESS_WORDS or "," in text):
+            found("Address", text, confidence)
+        else:
+            remaining.append((text, confidence))
+
+    for text, confidence in remaining:
+        tokens = text.split()
+        if "Person Name" not in fields and 2 <= len(tokens) <= 4 and all(t[:1].isupper() and t.replace(".", "").isalpha() for t in tokens):
+            found("Person Name", text, confidence)
+        elif "Company Name" not in fields and text.strip():
+            # Lower confidence: an unlabeled line is only a guess at the company.
+            found("Company Name", text, confidence * 0.8)
+    return fields
+
+
+def extract_local(image_bytes, min_confidence=DEFAULT_MIN_CONFIDENCE, trusted_fields=None):
+    """Run the offline OCR tier on a card.
+
+    Returns (info, unresolved, resolved): info holds the fields read with at least min_confidence
+    (only those in trusted_fields, if given), unresolved lists the standard fields still missing,
+    and resolved tells whether nothing is left to ask the API for.
+    """
+    fields = parse_lines(ocr_lines(image_bytes))
+    info = {field: value for field, (value, confidence) in fields.items()
+            if confidence >= min_confidence and (trusted_fields is None or field in trusted_fields)}
+    unresolved = [field for field in STANDARD_FIELDS if field not in info]
+    return info, unresolved, not unresolved
@@ -0,0 +1,264 @@
+import hashlib
+import re
+import threading
+from pathlib import Path
+
+import metrics
+from db import add_missing_column, connect, write_transaction
+from dedup import DEFAULT_COUNTRY_CODE, DEFAULT_MERGE_THRESHOLD, blocking_keys, canonical_record, match_score
+from fields import normalize_fields
+
+MASTER_HEADERS = ["File Name", "Company Name", "Person Name", "Designation", "Phone", "Email", "Website", "Address"]
+COLUMNS = ["file_name", "company_name", "person_name", "designation", "phone", "email", "website", "address"]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS contacts (
+    id INTEGER PRIMARY KEY,
+    namespace TEXT NOT NULL DEFAULT '',
+    {", ".join(f"{column} TEXT NOT NULL DEFAULT ''" for column in COLUMNS)},
+    name_key TEXT NOT NULL,
+    email_key TEXT NOT NULL,
+    phone_key TEXT NOT NULL,
+    row_key TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS contact_blocks (
+    namespace TEXT NOT NULL DEFAULT '',
+    block_key TEXT NOT NULL,
+    contact_id INTEGER NOT NULL
+);
+"""
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_contacts_ns_name_email ON contacts (namespace, name_key, email_key);
+CREATE INDEX IF NOT EXISTS idx_contacts_ns_name_phone ON contacts (namespace, name_key, phone_key);
+CREATE INDEX IF NOT EXISTS idx_contacts_ns_row_key ON contacts (namespace, row_key);
+CREATE INDEX IF NOT EXISTS idx_contact_blocks_ns_key ON contact_blocks (namespace, block_key);
+CREATE INDEX IF NOT EXISTS idx_contact_blocks_contact ON contact_blocks (contact_id);
+"""
+# Indexes from before namespaces existed; the namespaced ones above replace them.
+LEGACY_INDEXES = ("idx_contacts_name_email", "idx_contacts_name_phone", "idx_contacts_row_key", "idx_contact_blocks_key")
+DEFAULT_NAMESPACE = ""
+MAX_BLOCK_CANDIDATES = 200
+REDEDUPE_CHUNK_SIZE = 200
+EXPORT_CHUNK_SIZE = 500
+
+
+def clean_cell(value):
+    return str(value).strip() if value is not None else ""
+
+
+def row_keys(row):
+    row = [clean_cell(cell) for cell in row]
+    return {
+        "name_key": row[2].lower(),
+        "email_key": row[5].lower(),
+        "phone_key": row[4].lower(),
+        # The file name is not part of the identity of a contact.
+        "row_key": hashlib.md5("\x1f".join(row[1:]).encode("utf-8")).hexdigest(),
+    }
+
+
+def namespace_slug(namespace):
+    """File-name-safe form of a namespace. Names that needed escaping get a short hash so two teams never share a file."""
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "-", namespace).strip("-")
+    if slug != namespace:
+        slug = "-".join(filter(None, [slug, hashlib.md5(namespace.encode("utf-8")).hexdigest()[:8]]))
+    return slug
+
+
+def to_master_row(info_dict, file_name):
+    normalized_data = normalize_fields(info_dict)
+    return [file_name] + [normalized_data.get(header, "") for header in MASTER_HEADERS[1:]]
+
+
+class MasterStore:
+    """Contacts of one namespace (team) in a SQLite file that several sessions and processes can write at once.
+
+    Each add is a short BEGIN IMMEDIATE transaction, so concurrent writers never insert the same
+    contact twice and never rewrite more than the rows they touch.
+    """
+
+    def __init__(self, path, merge_threshold=DEFAULT_MERGE_THRESHOLD, default_country_code=DEFAULT_COUNTRY_CODE,
+                 namespace=DEFAULT_NAMESPACE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.merge_threshold = merge_threshold
+        self.default_country_code = default_country_code
+        self.namespace = namespace or DEFAULT_NAMESPACE
+        self._lock = threading.Lock()
+        self._conn = connect(self.path)
+        self._conn.executescript(SCHEMA)
+        if add_missing_column(self._conn, "contacts", "namespace", "TEXT NOT NULL DEFAULT ''"):
+            add_missing_column(self._conn, "contact_blocks", "namespace", "TEXT NOT NULL DEFAULT ''")
+            self._conn.executescript("".join(f"DROP INDEX IF EXISTS {index};" for index in LEGACY_INDEXES))
+        self._conn.executescript(INDEXES)
+        with write_transaction(self._conn, self._lock):
+            has_contacts = self._conn.execute(
+                "SELECT 1 FROM contacts WHERE namespace = ? LIMIT 1", (self.namespace,)).fetchone()
+            has_blocks = self._conn.execute(
+                "SELECT 1 FROM contact_blocks WHERE namespace = ? LIMIT 1", (self.namespace,)).fetchone()
+            if has_contacts and not has_blocks:
+                for contact_id, row in self._fetch_rows():
+                    self._index_blocks(contact_id, row)
+
+    def _record(self, row):
+        return canonical_record(row, self.default_country_code)
+
+    def _fetch_rows(self, ids=None):
+        sql = f"SELECT id, {', '.join(COLUMNS)} FROM contacts WHERE namespace = ?"
+        if ids is not None:
+            sql += f" AND id IN ({', '.join('?' * len(ids))})"
+        return [(row[0], list(row[1:])) for row in self._conn.execute(sql + " ORDER BY id", [self.namespace] + list(ids or ()))]
+
+    def _index_blocks(self, contact_id, row):
+        self._conn.executemany(
+            "INSERT INTO contact_blocks (namespace, block_key, contact_id) VALUES (?, ?, ?)",
+            [(self.namespace, key, contact_id) for key in blocking_keys(self._record(row))],
+        )
+
+    def _is_exact_duplicate(self, keys, before_id=None):
+        namespace = self.namespace
+        queries = [("SELECT 1 FROM contacts WHERE namespace = ? AND row_key = ?", (namespace, keys["row_key"]))]
+        if keys["name_key"]:
+            if keys["email_key"]:
+                queries.append(("SELECT 1 FROM contacts WHERE namespace = ? AND name_key = ? AND email_key = ?",
+                                (namespace, keys["name_key"], keys["email_key"])))
+            if keys["phone_key"]:
+                queries.append(("SELECT 1 FROM contacts WHERE namespace = ? AND name_key = ? AND phone_key = ?",
+                                (namespace, keys["name_key"], keys["phone_key"])))
+        if before_id is not None:
+            queries = [(sql + " AND id < ?", params + (before_id,)) for sql, params in queries]
+        return any(self._conn.execute(sql + " LIMIT 1", params).fetchone() for sql, params in queries)
+
+    def _find_match(self, row, before_id=None):
+        """Return the id of the best-scoring existing contact at or above the merge threshold.
+
+        With before_id, only contacts older than that id are considered.
+        """
+        record = self._record(row)
+        keys = list(blocking_keys(record))
+        if not keys:
+            return None
+        sql = f"SELECT contact_id FROM contact_blocks WHERE namespace = ? AND block_key IN ({', '.join('?' * len(keys))})"
+        params = [self.namespace] + keys
+        if before_id is not None:
+            sql += " AND contact_id < ?"
+            params.append(before_id)
+        # Contacts sharing the most keys first, so a crowded block (a switchboard number) cannot
+        # crowd the likeliest matches out of the limit; newest first among equals.
+        candidate_ids = [contact_id for (contact_id,) in self._conn.execute(
+            sql + " GROUP BY contact_id ORDER BY COUNT(*) DESC, contact_id DESC LIMIT ?", params + [MAX_BLOCK_CANDIDATES],
+        )]
+        if not candidate_ids:
+            return None
+        best_id, best_score = None, self.merge_threshold
+        for contact_id, candidate in self._fetch_rows(candidate_ids):
+            score = match_score(record, self._record(candidate))
+            if score >= best_score:
+                best_id, best_score = contact_id, score
+        return best_id
+
+    def _merge_into(self, contact_id, row):
+        (_, existing), = self._fetch_rows([contact_id])
+        merged = existing[:1] + [old or new for old, new in zip(existing[1:], row[1:])]
+        if merged == existing:
+            return
+        keys = row_keys(merged)
+        self._conn.execute(
+            f"UPDATE contacts SET {', '.join(f'{column} = ?' for column in COLUMNS)}, "
+            "name_key = ?, email_key = ?, phone_key = ?, row_key = ? WHERE id = ?",
+            merged + [keys["name_key"], keys["email_key"], keys["phone_key"], keys["row_key"], contact_id],
+        )
+        self._conn.execute("DELETE FROM contact_blocks WHERE contact_id = ?", (contact_id,))
+        self._index_blocks(contact_id, merged)
+
+    def add(self, row):
+        """Insert a row laid out like MASTER_HEADERS.
+
+        Returns False if it duplicates an existing contact; blank fields of that contact are filled from the row.
+        """
+        with metrics.span("store_write"):
+            added = self._add(row)
+        metrics.inc("rows_written" if added else "duplicates_skipped")
+        return added
+
+    def _add(self, row):
+        row = [clean_cell(cell) for cell in row]
+        keys = row_keys(row)
+        with write_transaction(self._conn, self._lock):
+            if self._is_exact_duplicate(keys):
+                return False
+            match_id = self._find_match(row)
+            if match_id is not None:
+                self._merge_into(match_id, row)
+                return False
+            cursor = self._conn.execute(
+                f"INSERT INTO contacts (namespace, {', '.join(COLUMNS)}, name_key, email_key, phone_key, row_key) "
+                f"VALUES ({', '.join('?' * (len(COLUMNS) + 5))})",
+                [self.namespace] + row + [keys["name_key"], keys["email_key"], keys["phone_key"], keys["row_key"]],
+            )
+            self._index_blocks(cursor.lastrowid, row)
+            return True
+
+    def rededupe(self, chunk_size=REDEDUPE_CHUNK_SIZE, progress=None):
+        """Re-run duplicate detection over the whole store, oldest contact first. Returns the number removed.
+
+        Each chunk of contacts is its own short transaction, so other writers to the file (other
+        teams included) only wait for one chunk; the block index stays complete between chunks.
+        progress(done, total, removed) is called after each chunk.
+        """
+        total, removed, done, last_id = self.count(), 0, 0, 0
+        while True:
+            with write_transaction(self._conn, self._lock):
+                ids = [contact_id for (contact_id,) in self._conn.execute(
+                    "SELECT id FROM contacts WHERE namespace = ? AND id > ? ORDER BY id LIMIT ?",
+                    (self.namespace, last_id, chunk_size))]
+                for contact_id, row in self._fetch_rows(ids):
+                    # Reindexed even when kept, so keys from older releases are replaced.
+                    self._conn.execute("DELETE FROM contact_blocks WHERE contact_id = ?", (contact_id,))
+                    if not self._is_exact_duplicate(row_keys(row), before_id=contact_id):
+                        match_id = self._find_match(row, before_id=contact_id)
+                        if match_id is None:
+                            self._index_blocks(contact_id, row)
+                            continue
+                        self._merge_into(match_id, row)
+                    self._conn.execute("DELETE FROM contacts WHERE id = ?", (contact_id,))
+                    removed += 1
+            if not ids:
+                return removed
+            last_id, done = ids[-1], done + len(ids)
+            if progress:
+                progress(min(done, total), total, removed)
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM contacts WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+
+    def iter_rows(self, chunk_size=EXPORT_CHUNK_SIZE):
+        # A separate read connection lets exports stream without holding the writer lock.
+        conn = connect(self.path)
+        try:
+            cursor = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM contacts WHERE namespace = ? ORDER BY id", (self.namespace,))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+
+    def import_xlsx(self, xlsx_path):
+        import openpyxl
+
+        wb = openpyxl.load_workbook(xlsx_path, read_only=True)
+        try:
+            added = 0
+            for row in wb.active.iter_rows(min_row=2, values_only=True):
+                row = list(row[:len(MASTER_HEADERS)]) + [""] * (len(MASTER_HEADERS) - len(row))
+                added += self.add(row)
+            return added
+        finally:
+            wb.close()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
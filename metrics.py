@@ -0,0 +1,159 @@
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+PREFIX = "cardsnap_"
+# Readable by node_exporter, which usually runs as another user; the umask is read once at import.
+METRICS_FILE_MODE = 0o644
+UMASK = os.umask(0o022)
+os.umask(UMASK)
+# Upper bounds in seconds; wide enough for both a PIL decode and a slow API call.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stage spans, in pipeline order, as shown in the UI panel.
+STAGES = ("preprocess", "encode", "api_request", "parse", "store_write", "workbook_save")
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given quantile, or the largest bound if it overflows."""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.buckets[-1]
+
+
+class Metrics:
+    """Thread-safe counters and latency histograms for the ingestion pipeline."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            stages = {
+                name: {
+                    "count": histogram.count,
+                    "total_s": histogram.sum,
+                    "mean_s": histogram.sum / histogram.count if histogram.count else 0.0,
+                    "p50_s": histogram.quantile(0.50),
+                    "p95_s": histogram.quantile(0.95),
+                }
+                for name, histogram in self._histograms.items()
+            }
+        return {"counters": counters, "stages": stages}
+
+    def to_prometheus(self, prefix=PREFIX):
+        lines = []
+        with self._lock:
+            for name, value in sorted(self._counters.items()):
+                lines += [f"# TYPE {prefix}{name}_total counter", f"{prefix}{name}_total {value}"]
+            for name, histogram in sorted(self._histograms.items()):
+                metric = f"{prefix}{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines += [
+                    f'{metric}_bucket{{le="+Inf"}} {histogram.count}',
+                    f"{metric}_sum {histogram.sum}",
+                    f"{metric}_count {histogram.count}",
+                ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Atomically replace path with the Prometheus text format, for node_exporter's textfile collector."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=path.name, suffix=".tmp", dir=str(path.parent))
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+            # mkstemp creates the file 0600, which the collector could not read.
+            os.chmod(tmp_path, METRICS_FILE_MODE & ~UMASK)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+REGISTRY = Metrics()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+span = REGISTRY.span
+
+
+def serve_metrics(port, host="127.0.0.1", registry=REGISTRY):
+    """Serve GET /metrics in Prometheus text format on a daemon thread. Returns the server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            payload = registry.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
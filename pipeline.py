@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_REQUESTS_PER_SECOND = 2.0
+
+
+class RateLimiter:
+    def __init__(self, requests_per_second=DEFAULT_REQUESTS_PER_SECOND):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def release(self, status_code=None, latency=None):
+        # A fixed-rate limiter does not adapt; see scheduler.AdaptiveScheduler for one that does.
+        pass
+
+
+_host_limiters = {}
+_host_limiters_lock = threading.Lock()
+
+
+def get_host_limiter(url, requests_per_second=DEFAULT_REQUESTS_PER_SECOND, factory=RateLimiter):
+    host = urlparse(url).netloc
+    with _host_limiters_lock:
+        limiter = _host_limiters.get(host)
+        if limiter is None:
+            limiter = factory(requests_per_second)
+            _host_limiters[host] = limiter
+        return limiter
+
+
+def imap_ordered(fn, items, max_workers=DEFAULT_MAX_WORKERS, cancel_event=None):
+    """Run fn over items on a thread pool and yield (item, result, error) in input order.
+
+    At most 2 * max_workers items are in flight, so items may be a lazy iterator. Once cancel_event
+    is set no more items are taken and queued ones are dropped, but items already running are
+    still yielded, so work that has been paid for is never thrown away.
+    """
+    max_workers = max(1, int(max_workers))
+    window = deque()
+    cancelled = cancel_event.is_set if cancel_event is not None else (lambda: False)
+
+    def call(item):
+        try:
+            return fn(item), None
+        except Exception as e:
+            return None, e
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        for item in items:
+            if cancelled():
+                break
+            window.append((item, executor.submit(call, item)))
+            if len(window) >= max_workers * 2:
+                done_item, future = window.popleft()
+                yield (done_item,) + future.result()
+        while window:
+            done_item, future = window.popleft()
+            if cancelled() and future.cancel():
+                continue
+            yield (done_item,) + future.result()
+    finally:
+        # Also reached when the caller stops iterating early: queued items never start.
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
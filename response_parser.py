@@ -0,0 +1,85 @@
+import json
+
+from fields import STANDARD_FIELDS
+
+
+class MalformedResponseError(Exception):
+    pass
+
+
+def card_schema(fields=STANDARD_FIELDS):
+    return {
+        "type": "OBJECT",
+        "properties": {field: {"type": "STRING"} for field in fields},
+        "propertyOrdering": list(fields),
+    }
+
+
+def card_list_schema(fields=STANDARD_FIELDS):
+    return {"type": "ARRAY", "items": card_schema(fields)}
+
+
+def balanced_end(text, start):
+    """Index just past the object or array opening at text[start], or None if it never closes."""
+    stack = []
+    in_string = escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if not stack or stack.pop() != char:
+                return None
+            if not stack:
+                return index + 1
+    return None
+
+
+def find_json_value(text):
+    """Return the first balanced JSON object or array in text that parses, ignoring prose and code fences."""
+    start = 0
+    while True:
+        candidates = [index for index in (text.find("{", start), text.find("[", start)) if index >= 0]
+        if not candidates:
+            raise MalformedResponseError("No JSON object or array in response")
+        start = min(candidates)
+        end = balanced_end(text, start)
+        if end is not None:
+            try:
+                return json.loads(text[start:end])
+            except json.JSONDecodeError:
+                pass
+        start += 1
+
+
+def coerce_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return ", ".join(coerce_value(item) for item in value if item not in (None, ""))
+    if isinstance(value, dict):
+        return ", ".join(coerce_value(item) for item in value.values() if item not in (None, ""))
+    return str(value).strip()
+
+
+def validate_card(value):
+    if not isinstance(value, dict):
+        raise MalformedResponseError(f"Expected a JSON object, got {type(value).__name__}")
+    return {str(key): coerce_value(item) for key, item in value.items()}
+
+
+def validate_cards(value, count):
+    if isinstance(value, dict) and count == 1:
+        value = [value]
+    if not isinstance(value, list) or len(value) != count:
+        raise MalformedResponseError(f"Expected a JSON array of {count} objects")
+    return [validate_card(item) for item in value]
@@ -0,0 +1,189 @@
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+INTERACTIVE = 0
+BULK = 1
+
+THROTTLE_STATUS_CODES = {429, 503}
+DEFAULT_LATENCY_TARGET = 15.0
+DEFAULT_MIN_CONCURRENCY = 1
+DECREASE_FACTOR = 0.5
+# Additive increase per successful request, as a share of the configured maximum rate.
+RATE_INCREASE_STEP = 0.05
+# Back off at most once per window, so one burst of 429s does not collapse the limits to the floor.
+DECREASE_COOLDOWN = 1.0
+MIN_RATE_FRACTION = 0.1
+
+# Gemini bills each image as a fixed number of prompt tokens; text is roughly four characters a token.
+IMAGE_TOKENS = 258
+CHARS_PER_TOKEN = 4
+# USD per million tokens for gemini-1.5-flash prompts up to 128k tokens; override per model.
+DEFAULT_INPUT_PRICE_PER_MILLION = 0.075
+DEFAULT_OUTPUT_PRICE_PER_MILLION = 0.30
+
+_local = threading.local()
+
+
+def current_priority():
+    return getattr(_local, "priority", BULK)
+
+
+@contextmanager
+def priority(level):
+    """Run API calls made on this thread at the given priority."""
+    previous = current_priority()
+    _local.priority = level
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=1.0):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def reserve(self):
+        """Take one token and return how long the caller must wait for it. Not thread-safe on its own."""
+        if not self.rate:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return max(0.0, -self._tokens / self.rate)
+
+
+class AdaptiveScheduler:
+    """Token-bucket rate limit plus an AIMD concurrency window in front of API requests.
+
+    Each success raises the window by 1/window and the rate by a small step; a 429/503, a
+    connection error or a response slower than latency_target halves both. Waiting requests are
+    admitted in priority order, so interactive uploads overtake queued bulk work.
+    Drop-in for RateLimiter: GeminiClient calls acquire() before and release() after each attempt.
+    """
+
+    def __init__(self, requests_per_second, max_concurrency, min_concurrency=DEFAULT_MIN_CONCURRENCY,
+                 latency_target=DEFAULT_LATENCY_TARGET):
+        self.max_rate = requests_per_second
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.min_concurrency = max(1, min(int(min_concurrency), self.max_concurrency))
+        self.latency_target = latency_target
+        self.limit = float(self.max_concurrency)
+        self.bucket = TokenBucket(requests_per_second, capacity=self.max_concurrency)
+        self.throttled = 0
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._last_decrease = 0.0
+
+    def acquire(self, level=None):
+        entry = (current_priority() if level is None else level, next(self._sequence))
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            while self._waiting[0] != entry or self._in_flight >= int(self.limit):
+                self._cond.wait()
+            heapq.heappop(self._waiting)
+            self._in_flight += 1
+            delay = self.bucket.reserve()
+            self._cond.notify_all()
+        if delay > 0:
+            time.sleep(delay)
+
+    def release(self, status_code=None, latency=None):
+        with self._cond:
+            self._in_flight -= 1
+            overloaded = (status_code is None or status_code in THROTTLE_STATUS_CODES
+                          or (latency is not None and latency > self.latency_target))
+            if overloaded:
+                now = time.monotonic()
+                if now - self._last_decrease >= DECREASE_COOLDOWN:
+                    self._last_decrease = now
+                    self.throttled += 1
+                    self.limit = max(self.min_concurrency, self.limit * DECREASE_FACTOR)
+                    if self.max_rate:
+                        self.bucket.rate = max(self.max_rate * MIN_RATE_FRACTION, self.bucket.rate * DECREASE_FACTOR)
+            elif status_code < 400:
+                self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+                if self.max_rate:
+                    self.bucket.rate = min(self.max_rate, self.bucket.rate + self.max_rate * RATE_INCREASE_STEP)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "concurrency_limit": int(self.limit),
+                "requests_per_second": self.bucket.rate,
+                "in_flight": self._in_flight,
+                "waiting": len(self._waiting),
+                "throttled": self.throttled,
+            }
+
+
+def estimate_text_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def usage_from_response(data, prompt_text, image_count, response_text=""):
+    """Token usage of one generateContent call, from usageMetadata when the API reports it, else estimated."""
+    metadata = data.get("usageMetadata") or {}
+    image_tokens = sum(detail.get("tokenCount", 0) for detail in metadata.get("promptTokensDetails", [])
+                       if detail.get("modality") == "IMAGE") or image_count * IMAGE_TOKENS
+    return {
+        "input_tokens": metadata.get("promptTokenCount") or estimate_text_tokens(prompt_text) + image_tokens,
+        "output_tokens": metadata.get("candidatesTokenCount") or estimate_text_tokens(response_text),
+        "image_tokens": image_tokens,
+    }
+
+
+class UsageTracker:
+    """Running totals of requests, tokens and estimated spend, overall and per scope (e.g. per batch)."""
+
+    FIELDS = ("requests", "input_tokens", "output_tokens", "image_tokens", "estimated_cost")
+
+    def __init__(self, input_price_per_million=DEFAULT_INPUT_PRICE_PER_MILLION,
+                 output_price_per_million=DEFAULT_OUTPUT_PRICE_PER_MILLION):
+        self.input_price = input_price_per_million / 1_000_000
+        self.output_price = output_price_per_million / 1_000_000
+        self._lock = threading.Lock()
+        self._totals = dict.fromkeys(self.FIELDS, 0)
+        self._scopes = threading.local()
+
+    def record(self, input_tokens=0, output_tokens=0, image_tokens=0, requests=1):
+        usage = {
+            "requests": requests,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "image_tokens": image_tokens,
+            "estimated_cost": input_tokens * self.input_price + output_tokens * self.output_price,
+        }
+        with self._lock:
+            for name, value in usage.items():
+                self._totals[name] += value
+        for scope in getattr(self._scopes, "stack", ()):
+            for name, value in usage.items():
+                scope[name] += value
+        return usage
+
+    @contextmanager
+    def scope(self):
+        """Collect the usage recorded on this thread inside the block into the yielded dict."""
+        scope = dict.fromkeys(self.FIELDS, 0)
+        stack = self._scopes.__dict__.setdefault("stack", [])
+        stack.append(scope)
+        try:
+            yield scope
+        finally:
+            # Scopes nest per thread, so the innermost is always last; remove() would match by value.
+            stack.pop()
+
+    def totals(self):
+        with self._lock:
+            return dict(self._totals)